@@ -1,4 +1,3 @@
-from FlagEmbedding import FlagModel
 import uuid
 from pydantic_ai.models.ollama import OllamaModel
 from typing import Optional, Union, List
@@ -7,7 +6,6 @@ from pydantic_ai import Agent, RunContext, Tool
 import ast
 import os
 import asyncio
-import logfire
 from dotenv import load_dotenv
 import subprocess
 import sys
@@ -16,7 +14,6 @@ from pydantic_ai_expert import PydanticAIDeps, pydantic_ai_expert
 
 
 load_dotenv()
-logfire.configure()
 
 
 class SolutionArchitect(Agent):
@@ -231,6 +228,8 @@ async def main():
 
 
 async def main():
+    import logfire
+    logfire.configure()
 
     developer = Agent(
         OllamaModel(os.getenv("REASONING_MODEL")),
@@ -250,4 +249,16 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Run the developer agent.")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report the import time of this module and exit")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        from app.utils.startup_profile import profile_startup
+        profile_startup(__file__)
+    else:
+        asyncio.run(main())
@@ -1,13 +1,11 @@
 from pydantic_ai import Agent, RunContext, Tool
 from dotenv import load_dotenv
 import os
-import logfire
 
 import app.agents.tools
 
 # Load environment variables
 load_dotenv()
-logfire.configure()
 
 # LLM Model
 model = os.getenv("LLM_MODEL")
@@ -2,33 +2,80 @@ from __future__ import annotations as _annotations
 
 from dataclasses import dataclass
 from dotenv import load_dotenv
-import logfire
 import asyncio
-import httpx
+import datetime
 import os
+import time
 from pydantic_ai.models.ollama import OllamaModel
 from pydantic_ai import Agent, ModelRetry, RunContext
-from typing import List
-from supabase import create_client, Client
-from FlagEmbedding import FlagModel
+from typing import TYPE_CHECKING, List, Optional
+from app.utils.embeddings import EMBEDDING_DIMENSION, get_embedding_service
+from app.utils.context_assembly import ContextAssembler, count_tokens
+from app.utils.page_index import PageIndex
 from pydantic_ai.models.openai import OpenAIModel
 
+# The retrieval modules import numpy, they are imported on first use
+if TYPE_CHECKING:
+    from app.utils.hybrid_search import KeywordIndex, Reranker
+    from app.utils.query_cache import RetrievalCache
+    from app.utils.supabase_dal import SupabaseDAL
+    from app.utils.vector_index import LocalVectorIndex
+
 load_dotenv()
 
 model = OpenAIModel(model_name=os.getenv("ALI_BABA_MODEL_NAME"),
                     base_url=os.getenv("ALI_BABA_BASE_URL"), api_key=os.getenv("ALI_BABA_API_KEY"))
 
-logfire.configure(send_to_logfire='if-token-present')
-
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_KEY")
-)
+# "supabase" queries the match_site_pages RPC, "local" searches an index
+# built with app/utils/vector_index.py and needs no Supabase connection
+RAG_BACKEND = os.getenv("RAG_BACKEND", "supabase")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils", "output", "vector_index"))
+
+# Created on first use, so importing this module (as the developer agents
+# do) stays cheap
+supabase: "SupabaseDAL" = None
+
+# Vector and keyword retrieval each return RAG_CANDIDATES chunks, their
+# fused ranking (optionally reranked by a cross-encoder such as
+# BAAI/bge-reranker-base) is cut down to RAG_RESULT_COUNT chunks
+RAG_CANDIDATES = int(os.getenv("RAG_CANDIDATES", "20"))
+RAG_RESULT_COUNT = int(os.getenv("RAG_RESULT_COUNT", "3"))
+RAG_RERANKER = os.getenv("RAG_RERANKER")
+
+# Ingestion marks the index as updated after every batch it writes, the
+# keyword and page indexes pick up those changes at most every
+# INDEX_REFRESH_INTERVAL seconds. The keyword index only fetches the chunks
+# crawled since its last refresh, and refetches everything (to drop deleted
+# chunks) every KEYWORD_INDEX_FULL_REFRESH seconds.
+INDEX_REFRESH_INTERVAL = float(os.getenv("INDEX_REFRESH_INTERVAL", "60"))
+KEYWORD_INDEX_FULL_REFRESH = float(
+    os.getenv("KEYWORD_INDEX_FULL_REFRESH", "3600"))
+# Chunks are stamped when they are built, some time before they are written
+KEYWORD_INDEX_SYNC_MARGIN = 600
+
+local_index = None
+keyword_index = None
+keyword_index_version = None
+keyword_index_refreshed_at = 0.0
+keyword_index_built_at = 0.0
+keyword_index_synced_at = None
+page_index = None
+page_index_version = None
+page_index_refreshed_at = 0.0
+reranker = None
+retrieval_cache = None
+
+# Token budgets of a RAG result and of one section of a page
+rag_context = ContextAssembler(
+    token_budget=int(os.getenv("RAG_TOKEN_BUDGET", "3000")))
+page_context = ContextAssembler(
+    token_budget=int(os.getenv("PAGE_TOKEN_BUDGET", "4000")))
 
 
 @dataclass
 class PydanticAIDeps:
-    supabase: Client
+    supabase: SupabaseDAL
 
 
 system_prompt = """
@@ -54,15 +101,124 @@ pydantic_ai_expert = Agent(
 
 
 async def get_embedding(text: str) -> List[float]:
-    """Get embedding vector from OpenAI."""
+    """Get embedding vector from the shared embedding model."""
     try:
-        model = FlagModel('BAAI/bge-base-en-v1.5',
-                          query_instruction_for_retrieval="Represent this sentence for searching relevant passages:",
-                          use_fp16=True)
-        return model.encode(text).tolist()
+        return await get_embedding_service().aencode(text)
     except Exception as e:
         print(f"Error getting embedding: {e}")
-        return [0] * 768  # Return zero vector on error
+        return [0] * EMBEDDING_DIMENSION  # Return zero vector on error
+
+
+def get_supabase() -> "SupabaseDAL":
+    """Return the Supabase data access layer, creating it on first use."""
+    global supabase
+
+    if supabase is None:
+        from app.utils.supabase_dal import get_dal
+        supabase = get_dal()
+    return supabase
+
+
+def get_retrieval_cache() -> RetrievalCache:
+    """Create the retrieval cache on first use."""
+    global retrieval_cache
+
+    if retrieval_cache is None:
+        from app.utils.query_cache import RetrievalCache
+        retrieval_cache = RetrievalCache(
+            max_entries=int(os.getenv("RETRIEVAL_CACHE_SIZE", "256")),
+            ttl=float(os.getenv("RETRIEVAL_CACHE_TTL", "3600")),
+            similarity_threshold=float(
+                os.getenv("RETRIEVAL_CACHE_SIMILARITY", "0.97")),
+            quantization=os.getenv("RETRIEVAL_CACHE_QUANTIZATION", "float16")
+        )
+    return retrieval_cache
+
+
+def get_reranker() -> Optional[Reranker]:
+    """Create the reranker on first use, None unless RAG_RERANKER is set."""
+    global reranker
+
+    if reranker is None and RAG_RERANKER:
+        from app.utils.hybrid_search import Reranker
+        reranker = Reranker(RAG_RERANKER)
+    return reranker
+
+
+def get_local_index() -> LocalVectorIndex:
+    """Load the local vector index on first use."""
+    global local_index
+
+    if local_index is None:
+        from app.utils.vector_index import LocalVectorIndex
+        local_index = LocalVectorIndex.load(LOCAL_INDEX_DIR)
+    return local_index
+
+
+async def get_keyword_index() -> KeywordIndex:
+    """Build the keyword index on first use and update it when ingestion writes chunks."""
+    global keyword_index, keyword_index_version, keyword_index_refreshed_at, \
+        keyword_index_built_at, keyword_index_synced_at
+    from app.utils.hybrid_search import KeywordIndex, merge_rows
+    from app.utils.query_cache import index_version
+    from app.utils.vector_index import ROW_COLUMNS
+
+    if RAG_BACKEND == "local":
+        # The local index is loaded once, so there is nothing to refresh
+        if keyword_index is None:
+            keyword_index = await asyncio.to_thread(KeywordIndex, get_local_index().rows)
+        return keyword_index
+
+    version = index_version()
+    now = time.monotonic()
+    if keyword_index is not None and (version == keyword_index_version or
+                                      now - keyword_index_refreshed_at < INDEX_REFRESH_INTERVAL):
+        return keyword_index
+
+    filters = [('metadata->>source', 'eq', 'pydantic_ai_docs')]
+    synced_at = datetime.datetime.now(datetime.timezone.utc) - \
+        datetime.timedelta(seconds=KEYWORD_INDEX_SYNC_MARGIN)
+    if keyword_index is None or now - keyword_index_built_at >= KEYWORD_INDEX_FULL_REFRESH:
+        rows = await get_supabase().select_all('site_pages', ", ".join(ROW_COLUMNS), filters)
+        keyword_index_built_at = now
+    else:
+        changed = await get_supabase().select_all(
+            'site_pages', ", ".join(ROW_COLUMNS),
+            filters + [('metadata->>crawled_at', 'gte', keyword_index_synced_at)])
+        rows = merge_rows(keyword_index.rows, changed)
+        print(f"Keyword index: {len(changed)} changed chunks")
+
+    keyword_index = await asyncio.to_thread(KeywordIndex, rows)
+    keyword_index_version = version
+    keyword_index_refreshed_at = now
+    # Without a UTC offset, which would need escaping in the query string,
+    # this still compares correctly with the stored ISO timestamps
+    keyword_index_synced_at = synced_at.strftime("%Y-%m-%dT%H:%M:%S")
+    return keyword_index
+
+
+async def get_page_index() -> PageIndex:
+    """Build the page index on first use and rebuild it when ingestion updates the chunks."""
+    global page_index, page_index_version, page_index_refreshed_at
+    from app.utils.query_cache import index_version
+
+    version = index_version()
+    now = time.monotonic()
+    if page_index is None or (version != page_index_version and
+                              now - page_index_refreshed_at >= INDEX_REFRESH_INTERVAL):
+        if keyword_index is not None and keyword_index_version == version:
+            rows = keyword_index.rows
+        elif RAG_BACKEND == "local":
+            rows = get_local_index().rows
+        else:
+            rows = await get_supabase().select_all(
+                'site_pages', 'url, title, chunk_number, metadata',
+                filters=[('metadata->>source', 'eq', 'pydantic_ai_docs')])
+        page_index = PageIndex(
+            [row for row in rows if (row.get('metadata') or {}).get('source') == 'pydantic_ai_docs'])
+        page_index_version = version
+        page_index_refreshed_at = now
+    return page_index
 
 
 @pydantic_ai_expert.tool
@@ -75,39 +231,61 @@ async def retrieve_relevant_documentation(ctx: RunContext[PydanticAIDeps], user_
         user_query: The user's question or query
 
     Returns:
-        A formatted string containing the top 5 most relevant documentation chunks
+        A formatted string containing the most relevant documentation chunks
     """
-    global supabase
+    from app.utils.hybrid_search import reciprocal_rank_fusion
 
     try:
+        retrieval_cache = get_retrieval_cache()
+        reranker = get_reranker()
+
         # Get the embedding for the query
-        query_embedding = await get_embedding(user_query)
-
-        # Query Supabase for relevant documents
-        result = supabase.rpc(
-            'match_site_pages',
-            {
-                'query_embedding': query_embedding,
-                'match_count': 5,
-                'filter': {'source': 'pydantic_ai_docs'}
-            }
-        ).execute()
-
-        if not result.data:
+        query_embedding = retrieval_cache.get_embedding(user_query)
+        if query_embedding is None:
+            query_embedding = await get_embedding(user_query)
+            if any(query_embedding):  # Do not cache the zero vector of a failure
+                retrieval_cache.put_embedding(user_query, query_embedding)
+
+        match_count = RAG_CANDIDATES
+        filter = {'source': 'pydantic_ai_docs'}
+
+        # Query Supabase (or the local index) for similar documents
+        docs = retrieval_cache.get_results(
+            query_embedding, match_count, filter)
+        if docs is None:
+            if RAG_BACKEND == "local":
+                docs = get_local_index().match(
+                    query_embedding, match_count, filter)
+            else:
+                docs = await get_supabase().rpc(
+                    'match_site_pages',
+                    {
+                        'query_embedding': query_embedding,
+                        'match_count': match_count,
+                        'filter': filter
+                    }
+                )
+            retrieval_cache.put_results(
+                query_embedding, match_count, filter, docs)
+
+        # Combine with keyword matches, which catch exact API names
+        index = await get_keyword_index()
+        keyword_docs = index.search(user_query, RAG_CANDIDATES, filter)
+        docs = reciprocal_rank_fusion([docs or [], keyword_docs])[
+            :RAG_CANDIDATES]
+
+        if reranker:
+            docs = await asyncio.to_thread(reranker.rerank, user_query, docs)
+        docs = docs[:RAG_RESULT_COUNT]
+
+        if not docs:
             return "No relevant documentation found."
 
-        # Format the results
-        formatted_chunks = []
-        for doc in result.data:
-            chunk_text = f"""
-# {doc['title']}
-
-{doc['content']}
-"""
-            formatted_chunks.append(chunk_text)
-
-        # Join all chunks with a separator
-        return "\n\n---\n\n".join(formatted_chunks)
+        # Format the results within the token budget
+        context = rag_context.assemble(docs)
+        print(
+            f"RAG context: {context.tokens} tokens, {context.tokens_saved} saved, {len(context.summarised)} summarised")
+        return context.text
 
     except Exception as e:
         print(f"Error retrieving documentation: {e}")
@@ -115,71 +293,89 @@ async def retrieve_relevant_documentation(ctx: RunContext[PydanticAIDeps], user_
 
 
 @pydantic_ai_expert.tool
-async def list_documentation_pages(ctx: RunContext[PydanticAIDeps]) -> List[str]:
+async def list_documentation_pages(ctx: RunContext[PydanticAIDeps], path_prefix: str = "",
+                                   page: int = 1, page_size: int = 100) -> str:
     """
-    Retrieve a list of all available Pydantic AI documentation pages.
+    Retrieve a list of the available Pydantic AI documentation pages.
+
+    Args:
+        ctx: The context including the Supabase client
+        path_prefix: Only list pages whose URL or URL path starts with this, e.g. "/api/"
+        page: The page of results to return, starting at 1
+        page_size: The number of pages per result page
 
     Returns:
-        List[str]: List of unique URLs for all documentation pages
+        str: One line per documentation page with its URL, title and number of chunks
     """
-    global supabase
 
     try:
-        # Query Supabase for unique URLs where source is pydantic_ai_docs
-        result = supabase.from_('site_pages') \
-            .select('url') \
-            .eq('metadata->>source', 'pydantic_ai_docs') \
-            .execute()
+        index = await get_page_index()
+        total = len(index.filter(path_prefix))
+        if not total:
+            return "No documentation pages found."
 
-        if not result.data:
-            return []
+        offset = (max(page, 1) - 1) * page_size
+        entries = index.page(path_prefix, offset, page_size)
 
-        # Extract unique URLs
-        urls = sorted(set(doc['url'] for doc in result.data))
-        return urls
+        lines = [f"{entry.url} | {entry.title} | {entry.chunks} chunks" for entry in entries]
+        header = f"Pages {offset + 1}-{offset + len(entries)} of {total}"
+        if offset + len(entries) < total:
+            header += f" (call again with page={page + 1} for more)"
+        return "\n".join([header] + lines)
 
     except Exception as e:
         print(f"Error retrieving documentation pages: {e}")
-        return []
+        return f"Error retrieving documentation pages: {str(e)}"
 
 
 @pydantic_ai_expert.tool
-async def get_page_content(ctx: RunContext[PydanticAIDeps], url: str) -> str:
+async def get_page_content(ctx: RunContext[PydanticAIDeps], url: str, section: int = 1) -> str:
     """
-    Retrieve the full content of a specific documentation page by combining all its chunks.
+    Retrieve the content of a specific documentation page by combining its chunks.
+
+    Long pages are returned in sections that fit the context budget, the
+    returned text says which section it is and how many there are.
 
     Args:
         ctx: The context including the Supabase client
         url: The URL of the page to retrieve
+        section: The section of the page to return, starting at 1
 
     Returns:
-        str: The complete page content with all chunks combined in order
+        str: The requested section of the page content with its chunks combined in order
     """
-    global supabase
-
     try:
         # Query Supabase for all chunks of this URL, ordered by chunk_number
-        result = supabase.from_('site_pages') \
-            .select('title, content, chunk_number') \
-            .eq('url', url) \
-            .eq('metadata->>source', 'pydantic_ai_docs') \
-            .order('chunk_number') \
-            .execute()
-
-        if not result.data:
+        if RAG_BACKEND == "local":
+            chunks = get_local_index().select(
+                {'source': 'pydantic_ai_docs'}, url=url)
+        else:
+            chunks = await get_supabase().select(
+                'site_pages', 'title, content, chunk_number',
+                filters=[('url', 'eq', url),
+                         ('metadata->>source', 'eq', 'pydantic_ai_docs')],
+                order='chunk_number')
+
+        if not chunks:
             return f"No content found for URL: {url}"
 
-        # Format the page with its title and all chunks
-        page_title = result.data[0]['title'].split(
+        # Format the page with its title and the requested section
+        page_title = chunks[0]['title'].split(
             ' - ')[0]  # Get the main title
-        formatted_content = [f"# {page_title}\n"]
-
-        # Add each chunk's content
-        for chunk in result.data:
-            formatted_content.append(chunk['content'])
+        sections = page_context.page_sections(chunks)
+        section = min(max(section, 1), len(sections))
+        formatted_content = [f"# {page_title}\n", sections[section - 1]]
+        if len(sections) > 1:
+            formatted_content.append(
+                f"(Section {section} of {len(sections)}, call again with section={section + 1} for more)"
+                if section < len(sections) else f"(Section {section} of {len(sections)})")
 
         # Join everything together
-        return "\n\n".join(formatted_content)
+        content = "\n\n".join(formatted_content)
+        saved = page_context.record(count_tokens(content), sum(
+            count_tokens(chunk['content']) for chunk in chunks))
+        print(f"Page content: section {section} of {len(sections)}, {saved} tokens saved")
+        return content
 
     except Exception as e:
         print(f"Error retrieving page content: {e}")
@@ -187,6 +383,13 @@ async def get_page_content(ctx: RunContext[PydanticAIDeps], url: str) -> str:
 
 
 async def main():
+    import logfire
+    logfire.configure(send_to_logfire='if-token-present')
+
+    # Load the embedding model while the user types the first prompt
+    if os.getenv("EMBEDDING_WARMUP", "True").lower() == "true":
+        get_embedding_service().warm_up()
+
     prompt = ""
     messages = []
     while prompt != "exit":
@@ -195,5 +398,25 @@ async def main():
         print("Developer: " + result._all_messages[-1].parts[0].content)
         messages = result._all_messages
 
+    if retrieval_cache is not None:
+        print(f"Retrieval cache: {retrieval_cache.stats()}")
+    print(f"RAG context: {rag_context.stats()}")
+    print(f"Page context: {page_context.stats()}")
+    if supabase is not None:
+        print(f"Supabase: {supabase.stats()}")
+        await supabase.close()
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Chat with the Pydantic AI documentation expert.")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report the import time of this module and exit")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        from app.utils.startup_profile import profile_startup
+        profile_startup(__file__)
+    else:
+        asyncio.run(main())
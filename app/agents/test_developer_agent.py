@@ -1,4 +1,3 @@
-from FlagEmbedding import FlagModel
 import uuid
 from pydantic_ai.models.ollama import OllamaModel
 from pydantic_ai.models.openai import OpenAIModel
@@ -8,12 +7,12 @@ from pydantic_ai import Agent, RunContext, Tool
 import ast
 import os
 import asyncio
-import logfire
 from dotenv import load_dotenv
 import subprocess
 import sys
 import traceback
 from app.utils.code2exec import CodeExecutor
+from app.utils.embeddings import get_embedding_service
 from pydantic_ai_expert import PydanticAIDeps, pydantic_ai_expert
 
 load_dotenv()
@@ -78,9 +77,23 @@ class SolutionArchitect(Agent):
                 message_history = result._all_messages
 
                 code_executor = CodeExecutor()
+                response = result._all_messages[-1].parts[0].content
 
-                return code_executor.execute(
-                    result._all_messages[-1].parts[0].content)
+                # Missing code and syntax errors go straight back to
+                # the developer, without creating an environment for the code
+                error = code_executor.check(response)
+                if error:
+                    query = f"There is problem with the code. Please try again. \nErrors: {error}"
+                    continue
+
+                # Streaming shows the output while the script runs and stops
+                # it once it goes quiet for EXECUTION_IDLE_TIMEOUT seconds
+                if os.getenv("EXECUTION_STREAMING", "False").lower() == "true":
+                    return await code_executor.stream(
+                        response, on_line=lambda line: print(line.text, end=""),
+                        preflight=False)
+
+                return await code_executor.submit(response, preflight=False)
 
             except Exception as e:
                 query = f"There is problem with the code. Please try again. \nErrors: {e}"
@@ -102,6 +115,11 @@ agent = SolutionArchitect(
 
 async def main():
 
+    # The architect asks the documentation expert, which needs the embedding
+    # model, load it while the user types the first prompt
+    if os.getenv("EMBEDDING_WARMUP", "True").lower() == "true":
+        get_embedding_service().warm_up()
+
     prompt = ""
     messages = []
     while prompt != "exit":
@@ -110,4 +128,16 @@ async def main():
         print("Architect: \n" + result)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Chat with the solution architect agent.")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report the import time of this module and exit")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        from app.utils.startup_profile import profile_startup
+        profile_startup(__file__)
+    else:
+        asyncio.run(main())
@@ -1,28 +1,19 @@
 import uuid
-import sendgrid
-from sendgrid.helpers.mail import Mail, To, Attachment, FileContent, FileName, FileType, Disposition
-from sendgrid import SendGridAPIClient
 from pydantic_ai.models.ollama import OllamaModel
 from typing import Optional, Union, List
-import openai
 from pydantic import BaseModel, Field, ValidationError
 from pydantic_ai import Agent, RunContext, Tool
-from playwright.sync_api import sync_playwright
 import ast
 import os
 import asyncio
 from pydantic_ai.models import ModelResponse
-import logfire
 from dotenv import load_dotenv
 from pydantic.dataclasses import dataclass
 import subprocess
 import sys
 import traceback
-from tavily import TavilyClient
 import base64
 
-logfire.configure()
-
 
 def search_tool(query: str) -> dict:
     """
@@ -34,6 +25,7 @@ def search_tool(query: str) -> dict:
     Returns:
         dict: the results of the search.
     """
+    from tavily import TavilyClient
 
     tavily_client = TavilyClient(
         api_key=os.getenv("TAVILY_API_KEY"))
@@ -55,6 +47,9 @@ def load_page_tool(url: str) -> str:
 
     """
 
+    import logfire
+    from playwright.sync_api import sync_playwright
+
     logfire.info(f"Loading page: {url}")
     content = ""
     with sync_playwright() as p:
@@ -88,6 +83,9 @@ def send_email_with_attachment_tool(to_email, subject, content, file_path):
     Returns:
         str: Status message indicating success or failure.
     """
+    from sendgrid import SendGridAPIClient
+    from sendgrid.helpers.mail import Mail, Attachment, FileContent, FileName, FileType, Disposition
+
     try:
         # Create the email
         message = Mail(
@@ -6,10 +6,9 @@ from app.agents.orchestrator_agent import *
 import asyncio
 import logfire
 
-logfire.configure()
-
 
 async def main():
+    logfire.configure()
 
     query = ""
 
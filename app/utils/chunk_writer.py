@@ -0,0 +1,131 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def is_rejected(error: Exception) -> bool:
+    """A 4xx other than a timeout or rate limit, the request itself (some row of it) is wrong."""
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and 400 <= status_code < 500 and status_code not in (408, 429)
+
+
+class ChunkWriter:
+    """
+    Buffered bulk writer for `site_pages` rows.
+
+    Rows are accumulated across documents and written as multi-row upserts
+    keyed on (url, chunk_number), so re-crawling a page overwrites its chunks
+    instead of duplicating them. This relies on the unique (url, chunk_number)
+    constraint of the `site_pages` table.
+
+    A batch is flushed when `batch_size` rows are buffered or every
+    `flush_interval` seconds, whichever comes first. Transient errors are
+    retried by the client (`SupabaseDAL` retries 5xx, timeouts and rate
+    limits), a batch that still fails is given up as a whole. A batch rejected
+    with a 4xx (see `is_rejected`) is split in halves, without waiting, so
+    that a single malformed row does not drop the rest of the batch.
+    `on_write` is called with the rows of every batch that was written.
+    `client` is a `SupabaseDAL`, or anything with the same async `upsert`.
+    """
+
+    def __init__(self, client, table: str = "site_pages", batch_size: int = 100,
+                 flush_interval: float = 2.0,
+                 on_conflict: str = "url,chunk_number",
+                 on_write: Optional[Callable[[List[Dict[str, Any]]], None]] = None):
+        self.client = client
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_conflict = on_conflict
+        self.on_write = on_write
+
+        self._buffer: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._closed = False
+
+        self.written = 0
+        self.batches = 0
+        self.failed: List[Dict[str, Any]] = []
+
+    async def add(self, row: Dict[str, Any]):
+        """
+        Buffer a row for the next upsert, flushing if the batch is full.
+
+        Args:
+            row: a `site_pages` row with at least `url` and `chunk_number`.
+        """
+        self._ensure_started()
+
+        # Later writes of the same chunk replace earlier ones, a single upsert
+        # statement cannot touch the same key twice
+        self._buffer[(row["url"], row["chunk_number"])] = row
+
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """Write all buffered rows."""
+        self._ensure_started()
+
+        async with self._flush_lock:
+            while self._buffer:
+                keys = list(self._buffer)[:self.batch_size]
+                rows = [self._buffer.pop(key) for key in keys]
+                await self._write(rows)
+
+    async def close(self):
+        """Stop the periodic flusher and write any remaining rows."""
+        self._closed = True
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        if self._buffer:
+            await self.flush()
+
+        print(
+            f"Chunk writer: {self.written} rows in {self.batches} batches, {len(self.failed)} failed")
+
+    def _ensure_started(self):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        if self._flusher is None and not self._closed:
+            self._flusher = asyncio.ensure_future(self._periodic_flush())
+
+    async def _periodic_flush(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing chunks: {e}")
+
+    async def _write(self, rows: List[Dict[str, Any]]):
+        try:
+            await self.client.upsert(self.table, rows, self.on_conflict)
+        except Exception as e:
+            print(f"Error upserting {len(rows)} chunks: {e}")
+            if not is_rejected(e):
+                self.failed.extend(rows)
+                print(f"Giving up on {len(rows)} chunks")
+                return
+            if len(rows) == 1:
+                self.failed.append(rows[0])
+                print(
+                    f"Giving up on chunk {rows[0]['chunk_number']} for {rows[0]['url']}")
+                return
+
+            # Isolate the rows that are rejected
+            middle = len(rows) // 2
+            await self._write(rows[:middle])
+            await self._write(rows[middle:])
+            return
+
+        self.written += len(rows)
+        self.batches += 1
+        print(f"Upserted {len(rows)} chunks into {self.table}")
+        if self.on_write:
+            self.on_write(rows)
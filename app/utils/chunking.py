@@ -0,0 +1,116 @@
+import re
+from functools import lru_cache
+from typing import List, Tuple
+
+# Rough stand-in for a BPE tokenizer: words and individual punctuation marks
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Separators tried in order, with the offset of the split relative to the match
+SEPARATORS = (("```", 0), ("\n\n", 0), (". ", 1))
+
+
+@lru_cache(maxsize=32)
+def _token_run(count: int) -> re.Pattern:
+    # Matches up to `count` tokens in one go, so windows are measured in C
+    return re.compile(r"(?:\s*(?:%s)){1,%d}" % (TOKEN_PATTERN.pattern, count))
+
+
+def chunk_spans(text: str, chunk_size: int = 5000, overlap: int = 0,
+                unit: str = "chars", min_fill: float = 0.3) -> List[Tuple[int, int]]:
+    """
+    Split text into chunks, respecting code blocks, paragraphs and sentences.
+
+    The text is never sliced while chunking: separators are searched for with
+    bounded `rfind` calls on the original string and chunks are returned as
+    offsets, so each character is looked at a small constant number of times.
+    A window is cut before the last code fence in it, otherwise at the last
+    paragraph break, otherwise after the last sentence, as long as that keeps
+    more than `min_fill` of the window.
+
+    Args:
+        text: the text to split.
+        chunk_size: maximum chunk size, in characters or tokens depending on `unit`.
+        overlap: how much of the end of a chunk is repeated at the start of the next one, in `unit`,
+            at most half of the chunk.
+        unit: "chars" or "tokens".
+        min_fill: smallest fraction of `chunk_size` a chunk is cut down to for a boundary.
+
+    Returns:
+        List[Tuple[int, int]]: (start, end) offsets of each chunk, stripped of surrounding whitespace.
+    """
+
+    if unit not in ("chars", "tokens"):
+        raise ValueError(f"Unknown chunk size unit: {unit}")
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be smaller than chunk_size")
+
+    text_length = len(text)
+
+    def advance(position: int, amount: int) -> int:
+        # Offset `amount` units after `position`
+        if unit == "chars":
+            return position + amount
+        match = _token_run(amount).match(text, position) if amount else None
+        return match.end() if match else text_length
+
+    spans = []
+    start = 0
+
+    while start < text_length:
+        end = advance(start, chunk_size)
+
+        if end >= text_length:
+            end = text_length
+        else:
+            earliest = advance(start, int(chunk_size * min_fill))
+            for separator, offset in SEPARATORS:
+                # Separators must lie completely inside the window
+                position = text.rfind(separator, earliest + 1, end)
+                if position != -1:
+                    end = position + offset
+                    break
+
+        # Strip surrounding whitespace by moving the offsets
+        chunk_start, chunk_end = start, end
+        while chunk_start < chunk_end and text[chunk_start].isspace():
+            chunk_start += 1
+        while chunk_end > chunk_start and text[chunk_end - 1].isspace():
+            chunk_end -= 1
+        if chunk_start < chunk_end:
+            spans.append((chunk_start, chunk_end))
+
+        if end >= text_length:
+            break
+
+        # Move start position for next chunk
+        next_start = end
+        if overlap:
+            if unit == "chars":
+                next_start = end - overlap
+            else:
+                # Only look at the tail of the chunk, wide enough for
+                # `overlap` tokens of typical length
+                lookback = max(start, end - overlap * 16)
+                starts = [match.start()
+                          for match in TOKEN_PATTERN.finditer(text, lookback, end)]
+                if len(starts) < overlap and lookback > start:
+                    starts = [match.start()
+                              for match in TOKEN_PATTERN.finditer(text, start, end)]
+                next_start = starts[-overlap] if len(starts) >= overlap else start
+
+        # A boundary cut can leave a chunk shorter than `overlap`, never
+        # repeat more than half of the chunk that was actually cut
+        midpoint = start + (end - start) // 2
+        if next_start < midpoint:
+            next_start = midpoint
+            if unit == "tokens":
+                match = TOKEN_PATTERN.search(text, midpoint, end)
+                next_start = match.start() if match else end
+        start = max(start + 1, next_start)
+
+    return spans
+
+
+def chunk_text(text: str, chunk_size: int = 5000, overlap: int = 0, unit: str = "chars") -> List[str]:
+    """Split text into chunks, respecting code blocks and paragraphs."""
+    return [text[start:end] for start, end in chunk_spans(text, chunk_size, overlap, unit)]
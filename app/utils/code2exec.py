@@ -1,9 +1,11 @@
-import re
 import os
-import subprocess
-import shutil
+import re
 import uuid
-import sys
+from app.utils.exec_cache import ExecutionCache, get_execution_cache
+from app.utils.exec_stream import StreamingExecution
+from app.utils.preflight import get_preflight_checker, preflight_enabled
+from app.utils.sandbox import ExecutionResult, get_execution_pool, run_sandboxed, warm_workers_enabled
+from app.utils.warm_workers import get_worker_pool
 
 
 class CodeExecutor:
@@ -13,7 +15,28 @@ class CodeExecutor:
         self.env_vars = ""
         self.execution_id = ""
 
-    def execute(self, llm_response):
+    def check(self, llm_response):
+        """
+        Statically check the code of `llm_response` without running it.
+
+        Returns:
+            Optional[PreflightError]: why the code cannot run (no code, or a
+            syntax error), or None if it passes or `EXECUTION_PREFLIGHT` is off.
+        """
+        code, requirements, _ = self._extract_function_and_requirements(llm_response)
+        result = self._preflight(code, requirements)
+        return result.preflight if result is not None else None
+
+    def execute(self, llm_response, use_cache=True, preflight=True):
+        """
+        Run the code of `llm_response` and return its output or failure.
+
+        Missing code and syntax errors are reported without running it,
+        unless `preflight` is False or `EXECUTION_PREFLIGHT` is "false". With
+        `EXECUTION_CACHE=true` the result of an identical earlier run is
+        returned without running the code again. Pass `use_cache=False` for
+        scripts with side effects or that depend on time or the network.
+        """
 
         self.code, self.requirements, self.env_vars = self._extract_function_and_requirements(
             llm_response)
@@ -22,76 +45,128 @@ class CodeExecutor:
         print(f"Requirements: {self.requirements}")
         print(f"Environment variables: {self.env_vars}")
         return self._execute_user_code(
-            self.code, self.requirements, self.env_vars)
+            self.code, self.requirements, self.env_vars, use_cache=use_cache, preflight=preflight)
 
-    def _execute_user_code(self, user_code, requirements, env_vars, venv_path=".venv_exec"):
+    async def submit(self, llm_response, use_cache=True, preflight=True):
+        """
+        Run the code of `llm_response` on the shared execution pool.
 
-        result = None
+        Unlike `execute`, this does not touch the executor's attributes, so
+        several responses can be validated concurrently with one executor.
+        Pass `preflight=False` if the response already went through `check`.
 
-        try:
-            # Step 1: Ensure the virtual environment exists
-            if not os.path.exists(venv_path):
-                print("Creating virtual environment...")
-                subprocess.check_call(
-                    [sys.executable, "-m", "venv", venv_path])
-
-            # Step 2: Create a temporary directory for user code execution
-            self.execution_id = uuid.uuid4().hex
-            exec_folder = f"user_code_exec_{self.execution_id}"
-            os.makedirs(exec_folder, exist_ok=True)
-            # print(f"Created temporary execution folder: {exec_folder}")
-
-            # Step 3: Write the user code to a Python script in the execution folder
-            script_path = os.path.join(exec_folder, "user_script.py")
-            with open(script_path, "w") as script_file:
-                script_file.write(user_code)
-            # print(f"User code written to: {script_path}")
-
-            # Step 4: Activate the virtual environment and install user requirements
-            pip_path = os.path.join(venv_path, "bin", "pip") if os.name != "nt" else os.path.join(
-                venv_path, "Scripts", "pip")
-            # print("Installing dependencies...")
-            for lib in requirements:
-                try:
-                    subprocess.check_call([pip_path, "install", lib])
-                except:
-                    pass
-            # print("Dependencies installed successfully")
-
-            # Step 5: Set environment variables
-            for env_var in env_vars:
-                try:
-                    key, value = env_var.split("=")
-                    os.environ[key] = value
-                except:
-                    pass
-            # print("Environment variables set")
-
-            # Step 6: Run the user script in the virtual environment
-            python_path = os.path.join(venv_path, "bin", "python") if os.name != "nt" else os.path.join(
-                venv_path, "Scripts", "python")
-            # print(f"Executing user script: {script_path}")
-            result = subprocess.run(
-                [python_path, script_path], capture_output=True, text=True)
-
-        except subprocess.CalledProcessError as e:
-            print(f"An error occurred: {e}")
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-        finally:
-            # Clean up the execution folder
-            if os.path.exists(exec_folder):
-                shutil.rmtree(exec_folder)
-                print(f"Cleaned up temporary execution folder: {exec_folder}")
-
-            # Check if the script ran successfully
-            if result.returncode == 0:
-                return result.stdout
-            else:
-                return f"""
+        Returns:
+            str: the script output, or the failure with its error output.
+        """
+        code, requirements, env_vars = self._extract_function_and_requirements(
+            llm_response)
+        result = self._preflight(code, requirements) if preflight else None
+        if result is not None:
+            return self._format_result(result)
+
+        cache, key, result = self._cached(code, requirements, env_vars, use_cache)
+        if result is None:
+            result = await get_execution_pool().submit(code, requirements, env_vars)
+            if cache:
+                cache.put(key, result)
+        return self._format_result(result)
+
+    async def stream(self, llm_response, on_line=None, cancel_on_traceback=False, use_cache=True,
+                     preflight=True):
+        """
+        Run the code of `llm_response`, passing its output lines to `on_line` as they arrive.
+
+        The script is stopped on its wall-clock timeout and after
+        `EXECUTION_IDLE_TIMEOUT` seconds without output. With
+        `cancel_on_traceback` it is also stopped as soon as it prints a
+        traceback, which suits scripts that do not log caught exceptions.
+        `preflight` is as in `submit`.
+
+        Returns:
+            str: the script output, or the failure with its error output.
+        """
+        code, requirements, env_vars = self._extract_function_and_requirements(
+            llm_response)
+        result = self._preflight(code, requirements) if preflight else None
+        if result is None:
+            cache, key, result = self._cached(code, requirements, env_vars, use_cache)
+        if result is not None:
+            return self._format_result(result)
+
+        idle_timeout = float(os.getenv("EXECUTION_IDLE_TIMEOUT", "60"))
+        execution = StreamingExecution(
+            code, requirements, env_vars, idle_timeout=idle_timeout or None,
+            max_output_bytes=int(os.getenv("EXECUTION_MAX_OUTPUT", "65536")),
+            cancel_on_traceback=cancel_on_traceback)
+        async for line in execution:
+            if on_line:
+                on_line(line)
+        result = execution.result or ExecutionResult(
+            returncode=None, error="The script ended without a result")
+        if cache:
+            cache.put(key, result)
+        return self._format_result(result)
+
+    @staticmethod
+    def _preflight(code, requirements):
+        """Return a failed result without running the code if it does not pass the pre-flight check."""
+        if not preflight_enabled():
+            return None
+        checker = get_preflight_checker()
+        error = checker.check(code, requirements)
+        if error is None:
+            return None
+        print(f"{error} ({checker.stats()['short_circuited']} executions short-circuited)")
+        return ExecutionResult(returncode=None, error=str(error), preflight=error)
+
+    @staticmethod
+    def _cached(code, requirements, env_vars, use_cache):
+        """Return the cache to store the result in, its key and the cached result if any."""
+        cache = get_execution_cache() if use_cache else None
+        if cache is None:
+            return None, None, None
+        key = ExecutionCache.make_key(code, requirements, env_vars)
+        result = cache.get(key)
+        if result is not None:
+            print(f"Reusing the result of an identical execution ({cache.stats()['hits']} cache hits)")
+        return cache, key, result
+
+    def _execute_user_code(self, user_code, requirements, env_vars, venv_path=None, use_cache=True,
+                           preflight=True):
+
+        self.execution_id = uuid.uuid4().hex
+
+        result = self._preflight(user_code, requirements) if preflight else None
+        if result is not None:
+            return self._format_result(result)
+
+        cache, key, result = self._cached(user_code, requirements, env_vars,
+                                          use_cache and venv_path is None)
+        if result is not None:
+            return self._format_result(result)
+
+        # The script runs in its own temporary directory with its own
+        # environment variables, see app/utils/sandbox.py
+        result = run_sandboxed(user_code, requirements, env_vars, venv_path=venv_path,
+                               workers=get_worker_pool() if warm_workers_enabled() else None)
+        print(f"Execution {self.execution_id} finished in {result.duration:.1f}s "
+              f"with exit code {result.returncode}{' on a warm worker' if result.warm else ''}")
+        if cache:
+            cache.put(key, result)
+        return self._format_result(result)
+
+    @staticmethod
+    def _format_result(result: ExecutionResult) -> str:
+
+        # Check if the script ran successfully
+        if result.ok:
+            return result.stdout
+        else:
+            return f"""
                 Script execution failed
                 Error Output:
-                {result.stderr}
+                {result.stderr or result.error}
+                {result.error if result.stderr else ""}
                 """
 
     def _extract_function_and_requirements(self, text):
@@ -118,10 +193,8 @@ class CodeExecutor:
         except:
             requirements = []
 
-        try:
-            env_vars = dict([line.split("=")
-                             for line in env_vars.split("\n") if line])
-        except:
-            env_vars = []
+        # Variables listed without a value are passed from this process
+        env_vars = dict(line.strip().split("=", 1) if "=" in line else (line.strip(), "")
+                        for line in env_vars.split("\n") if line.strip())
 
         return code, requirements, env_vars
@@ -0,0 +1,182 @@
+import hashlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+from app.utils.chunking import TOKEN_PATTERN
+
+
+def count_tokens(text: str) -> int:
+    """Approximate the number of model tokens in `text`."""
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def trim_overlap(previous: str, current: str, probe: int = 200, min_overlap: int = 16) -> str:
+    """
+    Drop the start of `current` that repeats the end of `previous`.
+
+    Neighbouring chunks of a page overlap when they were chunked with an
+    overlap, this keeps the repeated text only once. The longest end of
+    `previous` that `current` starts with is dropped, unless it is shorter
+    than `min_overlap` characters and may be a coincidence.
+    """
+    head = current[:probe]
+    if not head:
+        return current
+    start = max(len(previous) - len(current), 0)
+
+    # An overlap at least as long as the probe contains it, searching forwards finds the longest first
+    position = previous.find(head, start)
+    while position != -1:
+        if current.startswith(previous[position:]):
+            return current[len(previous) - position:].lstrip()
+        position = previous.find(head, position + 1)
+
+    # A shorter overlap is an end of `previous` shorter than the probe
+    for position in range(max(len(previous) - len(head) + 1, start), len(previous) - min_overlap + 1):
+        if current.startswith(previous[position:]):
+            return current[len(previous) - position:].lstrip()
+    return current
+
+
+@dataclass
+class AssembledContext:
+    text: str
+    tokens: int
+    tokens_saved: int
+    full: List[str] = field(default_factory=list)
+    summarised: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+
+
+class ContextAssembler:
+    """
+    Fits retrieved chunks into a token budget for the model prompt.
+
+    Chunks are taken in ranking order. Duplicates are skipped and text
+    repeated between neighbouring chunks of a page is kept once. A chunk is
+    included in full when it fits the remaining budget, otherwise as its
+    title and summary, otherwise not at all.
+    """
+
+    def __init__(self, token_budget: int = 3000, separator: str = "\n\n---\n\n"):
+        self.token_budget = token_budget
+        self.separator = separator
+        self.calls = 0
+        self.total_tokens = 0
+        self.total_saved = 0
+
+    @staticmethod
+    def format_full(row: Dict[str, Any], content: str) -> str:
+        return f"""
+# {row['title']}
+
+{content}
+"""
+
+    @staticmethod
+    def format_summary(row: Dict[str, Any]) -> str:
+        return f"""
+# {row['title']}
+
+Summary: {row.get('summary') or ''}
+(Full text: {row['url']})
+"""
+
+    def record(self, tokens: int, naive_tokens: int) -> int:
+        """Count a call that used `tokens` instead of `naive_tokens` and return the tokens saved."""
+        saved = max(naive_tokens - tokens, 0)
+        self.calls += 1
+        self.total_tokens += tokens
+        self.total_saved += saved
+        return saved
+
+    def assemble(self, rows: List[Dict[str, Any]]) -> AssembledContext:
+        """
+        Build the context for a list of retrieved rows.
+
+        Args:
+            rows: rows with `url`, `chunk_number`, `title`, `summary` and `content`, best first.
+
+        Returns:
+            AssembledContext: the text and how many tokens it saved over joining every chunk in full.
+        """
+        separator_tokens = count_tokens(self.separator)
+        naive_tokens = sum(count_tokens(self.format_full(row, row['content'])) + separator_tokens
+                           for row in rows)
+
+        seen = set()
+        included: Dict[str, Dict[int, str]] = {}
+        parts = []
+        used = 0
+        result = AssembledContext(text="", tokens=0, tokens_saved=0)
+
+        for row in rows:
+            label = f"{row['url']}#{row.get('chunk_number')}"
+            digest = hashlib.sha256(row['content'].encode("utf-8")).digest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+
+            content = row['content']
+            neighbours = included.get(row['url'], {})
+            chunk_number = row.get('chunk_number')
+            if chunk_number is not None and chunk_number - 1 in neighbours:
+                content = trim_overlap(neighbours[chunk_number - 1], content)
+
+            remaining = self.token_budget - used - (separator_tokens if parts else 0)
+            full = self.format_full(row, content)
+            full_tokens = count_tokens(full)
+            if full_tokens <= remaining:
+                parts.append(full)
+                used += full_tokens + (separator_tokens if len(parts) > 1 else 0)
+                included.setdefault(row['url'], {})[chunk_number] = row['content']
+                result.full.append(label)
+                continue
+
+            summary = self.format_summary(row)
+            summary_tokens = count_tokens(summary)
+            if summary_tokens <= remaining:
+                parts.append(summary)
+                used += summary_tokens + (separator_tokens if len(parts) > 1 else 0)
+                result.summarised.append(label)
+            else:
+                result.dropped.append(label)
+
+        result.text = self.separator.join(parts)
+        result.tokens = used
+        result.tokens_saved = self.record(used, naive_tokens)
+        return result
+
+    def page_sections(self, chunks: List[Dict[str, Any]]) -> List[str]:
+        """
+        Group the ordered chunks of a page into sections that each fit the budget.
+
+        Text repeated between consecutive chunks is kept once. A single chunk
+        larger than the budget becomes a section of its own.
+        """
+        sections = []
+        current: List[str] = []
+        current_tokens = 0
+        previous = ""
+
+        for chunk in chunks:
+            content = trim_overlap(previous, chunk['content']) if previous else chunk['content']
+            previous = chunk['content']
+            tokens = count_tokens(content)
+            if current and current_tokens + tokens > self.token_budget:
+                sections.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(content)
+            current_tokens += tokens
+
+        if current:
+            sections.append("\n\n".join(current))
+        return sections
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "tokens": self.total_tokens,
+            "tokens_saved": self.total_saved,
+            "avg_tokens_saved": self.total_saved / self.calls if self.calls else 0.0,
+        }
@@ -0,0 +1,122 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+
+@dataclass
+class CachedPage:
+    url: str
+    markdown: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    crawled_at: str
+
+
+class CrawlCache:
+    """
+    Compressed on-disk store of crawled markdown.
+
+    Every page is one gzip file named after the hash of its URL. The first
+    line holds a JSON header with the URL and the `ETag` / `Last-Modified`
+    validators the server sent, the rest is the raw markdown. Stored pages can
+    be re-chunked and re-indexed without launching a browser, and the
+    validators let a crawl skip rendering pages the server reports unchanged.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".md.gz")
+
+    def put(self, url: str, markdown: str, headers: Optional[Dict[str, str]] = None):
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        header = {
+            "url": url,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "crawled_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        path = self._path(url)
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as cache_file:
+            cache_file.write(json.dumps(header) + "\n")
+            cache_file.write(markdown)
+        os.replace(tmp_path, path)
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        return self.read(self._path(url))
+
+    def header(self, url: str) -> Optional[Dict[str, Optional[str]]]:
+        """Return the stored validators of `url` without decompressing the page."""
+        path = self._path(url)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as cache_file:
+                return json.loads(cache_file.readline())
+        except Exception as e:
+            print(f"Error reading crawl cache for {url}: {e}")
+            return None
+
+    def files(self) -> List[str]:
+        """Return the paths of all stored pages."""
+        return [os.path.join(self.directory, name)
+                for name in sorted(os.listdir(self.directory)) if name.endswith(".md.gz")]
+
+    def pages(self) -> Iterator[CachedPage]:
+        """Iterate over every stored page."""
+        for path in self.files():
+            page = self.read(path)
+            if page:
+                yield page
+
+    def read(self, path: str) -> Optional[CachedPage]:
+        """Read a stored page from one of the paths returned by `files`."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as cache_file:
+                header = json.loads(cache_file.readline())
+                markdown = cache_file.read()
+        except Exception as e:
+            print(f"Error reading crawl cache file {path}: {e}")
+            return None
+
+        return CachedPage(url=header["url"], markdown=markdown, etag=header.get("etag"),
+                          last_modified=header.get("last_modified"), crawled_at=header.get("crawled_at"))
+
+
+async def is_not_modified(client: httpx.AsyncClient, url: str, header: Dict[str, Optional[str]]) -> bool:
+    """
+    Ask the server whether `url` changed since it was cached.
+
+    Args:
+        client: the HTTP client to send the conditional request with.
+        url: the page URL.
+        header: the cache header of the page, see `CrawlCache.header`.
+
+    Returns:
+        bool: True if the server answered 304 Not Modified.
+    """
+    headers = {}
+    if header.get("etag"):
+        headers["If-None-Match"] = header["etag"]
+    if header.get("last_modified"):
+        headers["If-Modified-Since"] = header["last_modified"]
+    if not headers:
+        return False
+
+    try:
+        response = await client.head(url, headers=headers)
+        return response.status_code == 304
+    except Exception as e:
+        print(f"Error revalidating {url}: {e}")
+        return False
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+
+def content_hash(text: str) -> str:
+    """Return a stable hash of a chunk's content."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CrawlManifest:
+    """
+    Local record of what has already been ingested.
+
+    For every URL the manifest keeps the sitemap `<lastmod>` seen when the
+    page was last processed and a content hash per chunk number. Incremental
+    runs use it to skip unchanged pages and to re-process only the chunks
+    whose content changed. Chunks only get their hash once they have been
+    written (see `start_page` and `confirm_chunk`), so whatever was still in
+    flight when a run stopped is processed again by the next one.
+
+    Example file layout:
+        {"https://ai.pydantic.dev/": {"lastmod": "2025-01-10", "chunks": {"0": "<sha256>"}}}
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pages: Dict[str, Dict] = {}
+        self._sitemap_lastmods: Dict[str, Optional[str]] = {}
+        self._pending: Dict[str, Dict[int, str]] = {}
+
+    def load(self) -> "CrawlManifest":
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as manifest_file:
+                    self.pages = json.load(manifest_file)
+            except Exception as e:
+                print(f"Error loading crawl manifest {self.path}: {e}")
+                self.pages = {}
+        return self
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as manifest_file:
+            json.dump(self.pages, manifest_file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def record_sitemap(self, url: str, lastmod: Optional[str]):
+        """Remember the `<lastmod>` of `url` from the current sitemap."""
+        self._sitemap_lastmods[url] = lastmod
+
+    def is_unchanged(self, url: str, lastmod: Optional[str]) -> bool:
+        """A page is unchanged when both runs report the same, known `<lastmod>`."""
+        page = self.pages.get(url)
+        return bool(page and lastmod and page.get("lastmod") == lastmod)
+
+    def changed_chunks(self, url: str, hashes: List[str]) -> List[int]:
+        """Return the chunk numbers of `url` whose hash differs from the last run."""
+        known = self.pages.get(url, {}).get("chunks", {})
+        return [i for i, chunk_hash in enumerate(hashes)
+                if known.get(str(i)) != chunk_hash]
+
+    def previous_chunk_count(self, url: str) -> int:
+        return len(self.pages.get(url, {}).get("chunks", {}))
+
+    def start_page(self, url: str, hashes: List[str], chunk_numbers: List[int]):
+        """
+        Record the new chunks of `url` before the changed ones are processed.
+
+        The chunks in `chunk_numbers` are left without a hash, and the page
+        without its sitemap `<lastmod>`, until `confirm_chunk` reports each of
+        them written.
+        """
+        pending = {i: hashes[i] for i in chunk_numbers}
+        self.pages[url] = {
+            "lastmod": None if pending else self._sitemap_lastmods.get(url),
+            "chunks": {str(i): None if i in pending else chunk_hash
+                       for i, chunk_hash in enumerate(hashes)}
+        }
+        if pending:
+            self._pending[url] = pending
+        else:
+            self._pending.pop(url, None)
+
+    def confirm_chunk(self, url: str, chunk_number: int):
+        """Record the hash of a written chunk, and the page's `<lastmod>` once all of its chunks are written."""
+        pending = self._pending.get(url)
+        if not pending or chunk_number not in pending:
+            return
+        self.pages[url]["chunks"][str(chunk_number)] = pending.pop(chunk_number)
+        if not pending:
+            del self._pending[url]
+            self.pages[url]["lastmod"] = self._sitemap_lastmods.get(url)
@@ -0,0 +1,131 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+
+class BrowserSessionPool:
+    """
+    Pool of crawl4ai browser sessions shared by concurrent crawl workers.
+
+    Each session is a separate browser page used by one URL at a time and is
+    closed and replaced after `max_pages_per_session` pages to keep browser
+    memory bounded. Requests are also limited per host: at most
+    `per_host_limit` pages of one host are fetched at the same time and
+    consecutive requests to a host start at least `min_host_interval`
+    seconds apart.
+    """
+
+    def __init__(self, crawler, size: int = 5, max_pages_per_session: int = 50,
+                 per_host_limit: int = 5, min_host_interval: float = 0.1):
+        self.crawler = crawler
+        self.size = size
+        self.max_pages_per_session = max_pages_per_session
+        self.per_host_limit = per_host_limit
+        self.min_host_interval = min_host_interval
+
+        self._sessions: Optional[asyncio.Queue] = None
+        self._session_pages: Dict[str, int] = {}
+        self._session_counter = 0
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._host_next_request: Dict[str, float] = defaultdict(float)
+
+        self.started_at = 0.0
+        self.crawled = 0
+        self.failed = 0
+        self.recycled = 0
+        self.crawl_time = 0.0
+        self.host_pages: Dict[str, int] = defaultdict(int)
+
+    def _new_session(self) -> str:
+        self._session_counter += 1
+        session_id = f"session{self._session_counter}"
+        self._session_pages[session_id] = 0
+        return session_id
+
+    def _ensure_started(self):
+        if self._sessions is None:
+            self.started_at = time.perf_counter()
+            self._sessions = asyncio.Queue()
+            for _ in range(self.size):
+                self._sessions.put_nowait(self._new_session())
+
+    async def _wait_for_host(self, host: str):
+        if host not in self._host_locks:
+            self._host_locks[host] = asyncio.Lock()
+        async with self._host_locks[host]:
+            delay = self._host_next_request[host] - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._host_next_request[host] = time.monotonic() + \
+                self.min_host_interval
+
+    async def _release_session(self, session_id: str):
+        self._session_pages[session_id] += 1
+        if self._session_pages[session_id] >= self.max_pages_per_session:
+            try:
+                await self.crawler.crawler_strategy.kill_session(session_id)
+            except Exception as e:
+                print(f"Error closing browser session {session_id}: {e}")
+            del self._session_pages[session_id]
+            self.recycled += 1
+            session_id = self._new_session()
+        self._sessions.put_nowait(session_id)
+
+    async def crawl(self, url: str, config):
+        """
+        Crawl `url` on a free session, respecting the per-host limits.
+
+        Args:
+            url: the page to crawl.
+            config: the `CrawlerRunConfig` to crawl with.
+
+        Returns:
+            The crawl4ai result of the page.
+        """
+        self._ensure_started()
+
+        host = urlparse(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(
+                self.per_host_limit)
+
+        async with self._host_semaphores[host]:
+            session_id = await self._sessions.get()
+            try:
+                await self._wait_for_host(host)
+                start = time.perf_counter()
+                result = await self.crawler.arun(url=url, config=config, session_id=session_id)
+                self.crawl_time += time.perf_counter() - start
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                await self._release_session(session_id)
+
+        if result.success:
+            self.crawled += 1
+            self.host_pages[host] += 1
+        else:
+            self.failed += 1
+        return result
+
+    def report(self) -> dict:
+        """Return and print crawl rate statistics."""
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        pages = self.crawled + self.failed
+        stats = {
+            "crawled": self.crawled,
+            "failed": self.failed,
+            "elapsed": elapsed,
+            "pages_per_minute": self.crawled * 60 / elapsed if elapsed else 0.0,
+            "avg_page_time": self.crawl_time / pages if pages else 0.0,
+            "sessions_recycled": self.recycled,
+            "hosts": dict(self.host_pages),
+        }
+        print(f"Crawled {stats['crawled']} pages ({stats['failed']} failed) in {elapsed:.1f}s, "
+              f"{stats['pages_per_minute']:.1f} pages/min, {stats['avg_page_time']:.2f}s per page, "
+              f"{self.recycled} sessions recycled")
+        return stats
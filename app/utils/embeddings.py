@@ -0,0 +1,229 @@
+import os
+import threading
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "BAAI/bge-base-en-v1.5")
+EMBEDDING_DIMENSION = 768
+QUERY_INSTRUCTION = "Represent this sentence for searching relevant passages:"
+
+
+class EmbeddingService:
+    """
+    Process-wide wrapper around a single FlagModel instance.
+
+    The model is loaded lazily on first use and shared by every caller in the
+    process. Encoding runs on a small dedicated thread pool so async callers
+    do not block the event loop.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, num_threads: Optional[int] = None):
+        self.model_name = model_name
+        self.num_threads = num_threads
+        self._model = None
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=num_threads or 1, thread_name_prefix="embedding")
+        self._metrics = {
+            "load_time": 0.0,
+            "encode_calls": 0,
+            "encoded_texts": 0,
+            "encode_time": 0.0,
+            "last_encode_time": 0.0,
+        }
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        """Load the model if it has not been loaded yet and return it."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from FlagEmbedding import FlagModel
+
+                    start = time.perf_counter()
+                    if self.num_threads:
+                        import torch
+                        torch.set_num_threads(self.num_threads)
+
+                    self._model = FlagModel(self.model_name,
+                                            query_instruction_for_retrieval=QUERY_INSTRUCTION,
+                                            use_fp16=True)
+                    self._metrics["load_time"] = time.perf_counter() - start
+                    print(
+                        f"Loaded embedding model {self.model_name} in {self._metrics['load_time']:.2f}s")
+        return self._model
+
+    def warm_up(self) -> threading.Thread:
+        """
+        Load the model and run a first encode on a background thread.
+
+        Meant to be started before waiting for user input, so the first
+        query does not pay for loading the model.
+        """
+        def run():
+            try:
+                start = time.perf_counter()
+                self.encode("warm up")
+                print(f"Embedding model warmed up in {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                print(f"Error warming up the embedding model: {e}")
+
+        thread = threading.Thread(
+            target=run, name="embedding-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def encode(self, texts: Union[str, List[str]]) -> Union[List[float], List[List[float]]]:
+        """
+        Encode a single text or a list of texts.
+
+        Args:
+            texts: a string or a list of strings to encode.
+
+        Returns:
+            A single vector for a string input, otherwise a list of vectors.
+        """
+        model = self.load()
+
+        start = time.perf_counter()
+        vectors = model.encode(texts).tolist()
+        elapsed = time.perf_counter() - start
+
+        with self._metrics_lock:
+            self._metrics["encode_calls"] += 1
+            self._metrics["encoded_texts"] += 1 if isinstance(
+                texts, str) else len(texts)
+            self._metrics["encode_time"] += elapsed
+            self._metrics["last_encode_time"] = elapsed
+
+        return vectors
+
+    async def aencode(self, texts: Union[str, List[str]]) -> Union[List[float], List[List[float]]]:
+        """Encode on the service thread pool without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.encode, texts)
+
+    def metrics(self) -> Dict[str, float]:
+        """Return load time and encode latency counters."""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        calls = metrics["encode_calls"]
+        metrics["avg_encode_time"] = metrics["encode_time"] / \
+            calls if calls else 0.0
+        return metrics
+
+
+_service: Optional[EmbeddingService] = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """
+    Return the shared embedding service, creating it on first use.
+
+    The number of encode threads can be pinned with the `EMBEDDING_THREADS`
+    environment variable.
+    """
+    global _service
+
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                num_threads = os.getenv("EMBEDDING_THREADS")
+                _service = EmbeddingService(
+                    num_threads=int(num_threads) if num_threads else None)
+    return _service
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching front end for the embedding service.
+
+    Concurrent callers of `embed` are queued until either `max_batch_size`
+    texts are waiting or `max_wait_ms` has elapsed since the first one
+    arrived. The queued texts are then encoded in a single call and each
+    caller receives its own vector. A batcher belongs to the event loop it is
+    first used on.
+    """
+
+    def __init__(self, service: Optional[EmbeddingService] = None,
+                 max_batch_size: int = 32, max_wait_ms: float = 20):
+        self.service = service or get_embedding_service()
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self.batches = 0
+        self.batched_texts = 0
+
+    async def embed(self, text: str) -> List[float]:
+        """
+        Queue `text` for the next batch and wait for its vector.
+
+        Args:
+            text: the text to encode.
+
+        Returns:
+            List[float]: the embedding vector of `text`.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(
+                self.max_wait_ms / 1000, self._flush)
+
+        return await future
+
+    async def drain(self):
+        """Encode whatever is queued right now and wait for in-flight batches."""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.ensure_future(self._encode(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _encode(self, batch: List[Tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in batch]
+        try:
+            vectors = await self.service.aencode(texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.batched_texts += len(texts)
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    def stats(self) -> Dict[str, float]:
+        """Return batch counters for tuning `max_batch_size` and `max_wait_ms`."""
+        return {
+            "batches": self.batches,
+            "batched_texts": self.batched_texts,
+            "avg_batch_size": self.batched_texts / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,88 @@
+import ast
+import hashlib
+import os
+import threading
+from dataclasses import replace
+from typing import Dict, Iterable, Optional, Union
+
+from app.utils.ttl_cache import TTLCache
+from app.utils.sandbox import ExecutionResult
+from app.utils.venv_pool import normalise_requirements
+
+
+def normalise_code(code: str) -> str:
+    """
+    Canonical form of a script that ignores comments and formatting.
+
+    Code that does not parse is compared with its line endings and trailing
+    whitespace normalised instead.
+    """
+    try:
+        return ast.dump(ast.parse(code))
+    except SyntaxError:
+        return "\n".join(line.rstrip() for line in code.strip().splitlines())
+
+
+def env_var_names(env_vars: Union[Dict[str, str], Iterable[str], None]) -> list:
+    if isinstance(env_vars, dict):
+        return sorted(name.strip() for name in env_vars)
+    return sorted(line.split("=", 1)[0].strip() for line in (env_vars or []) if line.strip())
+
+
+class ExecutionCache:
+    """
+    Results of previous executions, keyed by normalised code, requirement set and env var names.
+
+    Meant for deterministic scripts that a developer loop regenerates byte
+    for byte after a retry. Results that depend on anything else than the
+    key (time, network, the values of env vars) are served stale, so callers
+    should bypass the cache for side-effecting scripts. Only runs that
+    finished with an exit status are cached, timeouts, cancelled runs and
+    failed installs are not.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600):
+        self.results = TTLCache(max_entries, ttl)
+
+    @staticmethod
+    def make_key(code: str, requirements: Iterable[str],
+                 env_vars: Union[Dict[str, str], Iterable[str], None]) -> str:
+        digest = hashlib.sha256(normalise_code(code).encode("utf-8"))
+        for part in (normalise_requirements(requirements), env_var_names(env_vars)):
+            digest.update(b"\0" + "\n".join(part).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[ExecutionResult]:
+        result = self.results.get(key)
+        return replace(result, cached=True, duration=0.0) if result is not None else None
+
+    def put(self, key: str, result: ExecutionResult):
+        if result.returncode is not None and not result.timed_out and not result.cancelled:
+            self.results.put(key, result)
+
+    def stats(self) -> Dict[str, float]:
+        return self.results.stats()
+
+
+_cache: Optional[ExecutionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_execution_cache() -> Optional[ExecutionCache]:
+    """
+    Return the shared execution cache, or None unless `EXECUTION_CACHE` is "true".
+
+    Sized with `EXECUTION_CACHE_SIZE` and `EXECUTION_CACHE_TTL`.
+    """
+    global _cache
+
+    if os.getenv("EXECUTION_CACHE", "False").lower() != "true":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ExecutionCache(
+                    max_entries=int(os.getenv("EXECUTION_CACHE_SIZE", "256")),
+                    ttl=float(os.getenv("EXECUTION_CACHE_TTL", "3600"))
+                )
+    return _cache
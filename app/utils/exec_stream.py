@@ -0,0 +1,190 @@
+import asyncio
+import os
+import subprocess
+import tempfile
+import time
+from collections import deque
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import AsyncIterator, Deque, Dict, Iterable, Optional, Union
+
+from app.utils.sandbox import ExecutionResult, SandboxLimits, job_environment, limited_command
+from app.utils.venv_pool import RequirementsInstallError, VenvPool, get_venv_pool, venv_python
+
+TRACEBACK_START = "Traceback (most recent call last):"
+
+
+@dataclass
+class OutputLine:
+    stream: str  # "stdout" or "stderr"
+    text: str
+
+
+class OutputBuffer:
+    """Keeps the last `max_bytes` of output, dropping the oldest lines first."""
+
+    def __init__(self, max_bytes: int = 64 * 1024):
+        self.max_bytes = max_bytes
+        self.lines: Deque[str] = deque()
+        self.size = 0
+        self.dropped = 0
+
+    def append(self, line: str):
+        self.lines.append(line)
+        self.size += len(line)
+        while self.size > self.max_bytes and len(self.lines) > 1:
+            dropped = self.lines.popleft()
+            self.size -= len(dropped)
+            self.dropped += len(dropped)
+
+    def text(self) -> str:
+        prefix = f"[{self.dropped} characters of earlier output dropped]\n" if self.dropped else ""
+        return prefix + "".join(self.lines)
+
+
+class StreamingExecution:
+    """
+    Runs a sandboxed script and yields its output lines as they are printed.
+
+    Besides the wall-clock timeout of `limits`, the script is stopped when it
+    prints nothing for `idle_timeout` seconds. Only the last
+    `max_output_bytes` of each stream are kept for the result. With
+    `cancel_on_traceback` the script is stopped as soon as a traceback has
+    been printed (once stderr has been quiet for `traceback_grace` seconds).
+    That also stops scripts that log a caught exception's traceback and
+    carry on, so it is off by default. The
+    caller can also stop it at any time with `cancel`.
+
+    Usage:
+        execution = StreamingExecution(code, requirements, env_vars)
+        async for line in execution:
+            print(line.text, end="")
+        result = execution.result
+    """
+
+    def __init__(self, code: str, requirements: Iterable[str] = (),
+                 env_vars: Union[Dict[str, str], Iterable[str], None] = None,
+                 limits: Optional[SandboxLimits] = None, idle_timeout: Optional[float] = 60,
+                 max_output_bytes: int = 64 * 1024, cancel_on_traceback: bool = False,
+                 traceback_grace: float = 0.5, venv_path: Optional[str] = None,
+                 venv_pool: Optional[VenvPool] = None):
+        self.code = code
+        self.requirements = list(requirements)
+        self.env_vars = env_vars
+        self.limits = limits or SandboxLimits.from_env()
+        self.idle_timeout = idle_timeout
+        self.cancel_on_traceback = cancel_on_traceback
+        self.traceback_grace = traceback_grace
+        self.venv_path = venv_path
+        self.venv_pool = venv_pool
+        self.stdout = OutputBuffer(max_output_bytes)
+        self.stderr = OutputBuffer(max_output_bytes)
+        self.result: Optional[ExecutionResult] = None
+        self._cancelled = False
+        self._process: Optional[asyncio.subprocess.Process] = None
+
+    def cancel(self):
+        """Stop the script, the iteration ends and `result` is marked as cancelled."""
+        self._cancelled = True
+        if self._process and self._process.returncode is None:
+            self._process.kill()
+
+    async def _pump(self, stream: asyncio.StreamReader, name: str, queue: asyncio.Queue):
+        while True:
+            line = await stream.readline()
+            if not line:
+                break
+            await queue.put(OutputLine(name, line.decode("utf-8", errors="replace")))
+        await queue.put(None)
+
+    def __aiter__(self) -> AsyncIterator[OutputLine]:
+        return self._run()
+
+    async def _run(self) -> AsyncIterator[OutputLine]:
+        start = time.perf_counter()
+        lease = (self.venv_pool or get_venv_pool()).acquire(self.requirements) \
+            if self.venv_path is None else nullcontext(self.venv_path)
+
+        try:
+            venv_path = await asyncio.to_thread(lease.__enter__)
+        except (RequirementsInstallError, subprocess.CalledProcessError) as e:
+            self.result = ExecutionResult(returncode=None, error=str(e),
+                                          duration=time.perf_counter() - start)
+            return
+
+        job_dir = tempfile.TemporaryDirectory(prefix="user_code_exec_")
+        error = ""
+        timed_out = False
+        try:
+            script_path = os.path.join(job_dir.name, "user_script.py")
+            with open(script_path, "w") as script_file:
+                script_file.write(self.code)
+
+            limits = self.limits
+            try:
+                self._process = await asyncio.create_subprocess_exec(
+                    *limited_command(venv_python(venv_path), ["-u", script_path], limits),
+                    cwd=job_dir.name, env=job_environment(self.env_vars, job_dir.name),
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                    limit=2**20)
+            except OSError as e:
+                self.result = ExecutionResult(
+                    returncode=None, error=f"Could not start the script: {e}",
+                    duration=time.perf_counter() - start, install=getattr(lease, "report", None))
+                return
+
+            queue: asyncio.Queue = asyncio.Queue()
+            pumps = [asyncio.ensure_future(self._pump(self._process.stdout, "stdout", queue)),
+                     asyncio.ensure_future(self._pump(self._process.stderr, "stderr", queue))]
+            open_streams = 2
+            deadline = time.perf_counter() + limits.timeout if limits.timeout else None
+            traceback_seen = False
+
+            while open_streams and not self._cancelled:
+                waits = [self.idle_timeout]
+                if deadline is not None:
+                    waits.append(deadline - time.perf_counter())
+                if traceback_seen:
+                    waits.append(self.traceback_grace)
+                waits = [wait for wait in waits if wait is not None]
+                try:
+                    line = await asyncio.wait_for(queue.get(), min(waits) if waits else None)
+                except asyncio.TimeoutError:
+                    if traceback_seen:
+                        error = "Stopped after a traceback"
+                        self._cancelled = True
+                    elif deadline is not None and time.perf_counter() >= deadline:
+                        error = f"Script timed out after {limits.timeout}s"
+                        timed_out = True
+                    else:
+                        error = f"Script printed nothing for {self.idle_timeout}s"
+                        timed_out = True
+                    break
+
+                if line is None:
+                    open_streams -= 1
+                    continue
+                (self.stdout if line.stream == "stdout" else self.stderr).append(line.text)
+                if self.cancel_on_traceback and line.stream == "stderr" and line.text.startswith(TRACEBACK_START):
+                    traceback_seen = True
+                yield line
+
+            if self._process.returncode is None and (open_streams or self._cancelled):
+                self._process.kill()
+            returncode = await self._process.wait()
+            for pump in pumps:
+                pump.cancel()
+
+            if self._cancelled and not error:
+                error = "Cancelled"
+            self.result = ExecutionResult(
+                returncode=None if timed_out or self._cancelled else returncode,
+                stdout=self.stdout.text(), stderr=self.stderr.text(), error=error,
+                duration=time.perf_counter() - start, timed_out=timed_out,
+                install=getattr(lease, "report", None), cancelled=self._cancelled,
+                dropped_output=self.stdout.dropped + self.stderr.dropped)
+        finally:
+            if self._process and self._process.returncode is None:
+                self._process.kill()
+            job_dir.cleanup()
+            lease.__exit__(None, None, None)
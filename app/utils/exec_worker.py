@@ -0,0 +1,187 @@
+"""
+Warm worker process for running generated scripts, see app/utils/warm_workers.py.
+
+Started with the python of a pooled virtualenv, so it only uses the
+standard library. It imports the modules named on its command line once,
+then reads jobs from stdin. Each job runs in a forked child (or in this
+process where fork is not available) with its own working directory,
+environment, limits and a fresh `__main__` namespace. For every job the
+worker first answers with the pid of the child, whose process group the
+client kills if it gives up on the worker, and then with the exit status
+and output.
+
+Messages in both directions are a 4 byte big-endian length followed by
+that many bytes of JSON.
+"""
+import importlib
+import io
+import json
+import os
+import shutil
+import signal
+import struct
+import sys
+import tempfile
+import traceback
+
+
+def read_message(stream):
+    header = stream.read(4)
+    if len(header) < 4:
+        return None
+    (length,) = struct.unpack(">I", header)
+    return json.loads(stream.read(length).decode("utf-8"))
+
+
+def write_message(stream, message):
+    data = json.dumps(message).encode("utf-8")
+    stream.write(struct.pack(">I", len(data)) + data)
+    stream.flush()
+
+
+def run_script(job):
+    """Run the job's script as `__main__` and return its exit code."""
+    script = job["script"]
+    sys.argv = [script]
+    sys.path.insert(0, job["cwd"])
+    namespace = {"__name__": "__main__", "__file__": script,
+                 "__builtins__": __builtins__}
+    try:
+        with open(script, "r") as script_file:
+            source = script_file.read()
+        exec(compile(source, script, "exec"), namespace)
+        return 0
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException as e:
+        # Leave out the frame of this function, as if the script ran on its own
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        return 1
+
+
+def run_forked(job, output_dir, on_start):
+    # Outside the job directory, so the script does not see them
+    stdout_path = os.path.join(output_dir, "stdout")
+    stderr_path = os.path.join(output_dir, "stderr")
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            import resource
+
+            # Its own process group, so the job and anything it starts can be killed together
+            os.setpgid(0, 0)
+            os.chdir(job["cwd"])
+            os.environ.clear()
+            os.environ.update(job["env"])
+            stdout = os.open(stdout_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            stderr = os.open(stderr_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            os.dup2(stdout, 1)
+            os.dup2(stderr, 2)
+            sys.stdin = open(os.devnull, "r")
+            sys.stdout = io.TextIOWrapper(os.fdopen(1, "wb", closefd=False), line_buffering=False)
+            sys.stderr = io.TextIOWrapper(os.fdopen(2, "wb", closefd=False), line_buffering=True)
+
+            if job.get("cpu_seconds"):
+                resource.setrlimit(resource.RLIMIT_CPU, (job["cpu_seconds"], job["cpu_seconds"]))
+            if job.get("memory_mb"):
+                memory = job["memory_mb"] * 2**20
+                resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+            resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+            if job.get("timeout"):
+                # The default SIGALRM action ends the child
+                signal.signal(signal.SIGALRM, signal.SIG_DFL)
+                signal.alarm(max(int(job["timeout"] + 0.999), 1))
+
+            code = run_script(job)
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except BaseException:
+            code = 1
+        os._exit(code & 0xFF)
+
+    try:
+        os.setpgid(pid, pid)
+    except OSError:
+        pass  # The child already did it, or already exited
+    on_start(pid)
+    _, status = os.waitpid(pid, 0)
+    try:
+        # Processes the script started and left behind
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+    result = {"returncode": os.waitstatus_to_exitcode(status),
+              "timed_out": os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGALRM}
+    for name, path in (("stdout", stdout_path), ("stderr", stderr_path)):
+        try:
+            with open(path, "r", errors="replace") as output:
+                result[name] = output.read()
+            os.remove(path)
+        except OSError:
+            result[name] = ""
+    return result
+
+
+def run_in_process(job):
+    stdout, stderr = io.StringIO(), io.StringIO()
+    cwd, environ = os.getcwd(), dict(os.environ)
+    saved = sys.argv, list(sys.path), sys.stdout, sys.stderr
+    try:
+        os.chdir(job["cwd"])
+        os.environ.clear()
+        os.environ.update(job["env"])
+        sys.stdout, sys.stderr = stdout, stderr
+        code = run_script(job)
+    finally:
+        sys.argv, sys.path[:], sys.stdout, sys.stderr = saved
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+    return {"returncode": code, "timed_out": False,
+            "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+def main():
+    requests = sys.stdin.buffer
+    responses = os.fdopen(os.dup(1), "wb")
+    # Stray output of preloaded modules must not end up in the protocol stream
+    os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+
+    preloaded = []
+    for module in sys.argv[1:]:
+        try:
+            importlib.import_module(module)
+            preloaded.append(module)
+        except Exception:
+            pass
+    write_message(responses, {"ready": True, "preloaded": preloaded})
+
+    output_dir = tempfile.mkdtemp(prefix="exec_worker_")
+    try:
+        while True:
+            job = read_message(requests)
+            if job is None:
+                return
+            try:
+                if hasattr(os, "fork"):
+                    result = run_forked(job, output_dir,
+                                        lambda pid: write_message(responses, {"pid": pid}))
+                else:
+                    write_message(responses, {"pid": None})
+                    result = run_in_process(job)
+            except Exception:
+                result = {"returncode": None, "timed_out": False, "stdout": "",
+                          "stderr": traceback.format_exc()}
+            write_message(responses, result)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
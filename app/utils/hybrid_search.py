@@ -0,0 +1,135 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.vector_index import metadata_contains
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    # Underscores are kept so API names like `result_type` stay one term
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _row_key(row: Dict[str, Any]) -> Tuple[str, int]:
+    return row["url"], row["chunk_number"]
+
+
+class KeywordIndex:
+    """
+    In-memory BM25 inverted index over `site_pages` rows.
+
+    Titles and contents are indexed together, so exact API names that vector
+    similarity tends to miss still rank the chunks that mention them.
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]], k1: float = 1.5, b: float = 0.75):
+        self.rows = rows
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.lengths: List[int] = []
+
+        for i, row in enumerate(rows):
+            terms = tokenize(f"{row.get('title') or ''} {row.get('content') or ''}")
+            self.lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                self.postings[term].append((i, count))
+
+        self.average_length = sum(self.lengths) / \
+            len(self.lengths) if self.lengths else 0.0
+
+    def search(self, query: str, limit: int = 20,
+               filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Return the rows with the highest BM25 score for `query`.
+
+        Args:
+            query: the search text.
+            limit: maximum number of rows to return.
+            filter: metadata the rows must contain, as in `match_site_pages`.
+
+        Returns:
+            List[Dict[str, Any]]: matching rows with their `keyword_score`.
+        """
+        scores: Dict[int, float] = defaultdict(float)
+        total = len(self.rows)
+
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) /
+                           (len(postings) + 0.5))
+            for i, count in postings:
+                norm = 1 - self.b + self.b * \
+                    self.lengths[i] / (self.average_length or 1)
+                scores[i] += idf * count * \
+                    (self.k1 + 1) / (count + self.k1 * norm)
+
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        results = []
+        for i, score in ranked:
+            if filter and not metadata_contains(self.rows[i].get("metadata"), filter):
+                continue
+            results.append(dict(self.rows[i], keyword_score=score))
+            if len(results) >= limit:
+                break
+        return results
+
+
+def merge_rows(rows: List[Dict[str, Any]], changed: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Return `rows` with the rows of `changed` replacing those with the same (url, chunk_number)."""
+    merged = {_row_key(row): row for row in rows}
+    merged.update((_row_key(row), row) for row in changed)
+    return list(merged.values())
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], k: int = 60) -> List[Dict[str, Any]]:
+    """
+    Merge several ranked row lists into one.
+
+    Each row scores 1 / (k + rank) in every list it appears in, which rewards
+    rows ranked high by both retrievers without comparing their raw scores.
+    """
+    scores: Dict[Tuple[str, int], float] = defaultdict(float)
+    rows: Dict[Tuple[str, int], Dict[str, Any]] = {}
+
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            key = _row_key(row)
+            scores[key] += 1 / (k + rank + 1)
+            rows[key] = dict(rows.get(key, {}), **row)
+
+    return [dict(rows[key], fusion_score=score)
+            for key, score in sorted(scores.items(), key=lambda item: -item[1])]
+
+
+class Reranker:
+    """Lazily loaded cross-encoder that scores (query, chunk) pairs in one batch."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from FlagEmbedding import FlagReranker
+                    self._model = FlagReranker(self.model_name, use_fp16=True)
+        return self._model
+
+    def rerank(self, query: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not rows:
+            return rows
+        scores = self.load().compute_score(
+            [[query, f"{row.get('title') or ''}\n{row.get('content') or ''}"] for row in rows])
+        if not isinstance(scores, list):
+            scores = [scores]
+        ranked = sorted(zip(rows, scores), key=lambda item: -item[1])
+        return [dict(row, rerank_score=float(score)) for row, score in ranked]
@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class LLMResultCache:
+    """
+    Persistent, content-addressed cache for LLM results backed by SQLite.
+
+    Entries are keyed by a hash of the model name, the prompt and the input
+    text, so identical chunks are only sent to the model once, across pages
+    and across runs. When the cache grows beyond `max_entries` the least
+    recently used entries are evicted.
+
+    Writes are committed every `commit_every` changes and on `close`, so a
+    crash loses at most that many entries. From async code use `aget` and
+    `aput`, which run the SQLite calls on a worker thread.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000, commit_every: int = 50):
+        self.path = path
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._uncommitted = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT, last_access REAL)')
+        self.conn.execute(
+            'CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)')
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, text: str) -> str:
+        digest = hashlib.sha256()
+        for part in (model_name or "", prompt, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT value FROM llm_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.conn.execute(
+                'UPDATE llm_cache SET last_access = ? WHERE key = ?', (time.time(), key))
+            self._changed()
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self.conn.execute('INSERT OR REPLACE INTO llm_cache (key, value, last_access) VALUES (?, ?, ?)',
+                              (key, json.dumps(value), time.time()))
+            self._puts += 1
+            # Counting rows is a table scan, so the size bound is only checked periodically
+            if self._puts % 100 == 1:
+                self._evict()
+            self._changed()
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, value: Any):
+        await asyncio.to_thread(self.put, key, value)
+
+    def _changed(self):
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.conn.commit()
+            self._uncommitted = 0
+
+    def _evict(self):
+        count = self.conn.execute(
+            'SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute('DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access LIMIT ?)',
+                              (count - self.max_entries,))
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
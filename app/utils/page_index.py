@@ -0,0 +1,50 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+
+@dataclass
+class PageEntry:
+    url: str
+    title: str
+    chunks: int
+
+
+class PageIndex:
+    """
+    Distinct documentation pages with their title and chunk count.
+
+    Built once from `site_pages` rows (one per chunk) so listing pages does
+    not have to ship and de-duplicate every chunk row on each call.
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        pages: Dict[str, PageEntry] = {}
+        first_chunks: Dict[str, int] = {}
+
+        for row in rows:
+            url = row["url"]
+            chunk_number = row.get("chunk_number") or 0
+            page = pages.get(url)
+            if page is None:
+                page = pages[url] = PageEntry(url=url, title="", chunks=0)
+            page.chunks += 1
+
+            # The page title is taken from its first chunk
+            if url not in first_chunks or chunk_number < first_chunks[url]:
+                first_chunks[url] = chunk_number
+                page.title = (row.get("title") or "").split(" - ")[0]
+
+        self.pages = sorted(pages.values(), key=lambda page: page.url)
+
+    def filter(self, path_prefix: Optional[str] = None) -> List[PageEntry]:
+        """Return the pages whose URL or URL path starts with `path_prefix`."""
+        if not path_prefix:
+            return self.pages
+        return [page for page in self.pages
+                if page.url.startswith(path_prefix) or urlparse(page.url).path.startswith(path_prefix)]
+
+    def page(self, path_prefix: Optional[str] = None, offset: int = 0,
+             limit: Optional[int] = None) -> List[PageEntry]:
+        pages = self.filter(path_prefix)
+        return pages[offset:offset + limit] if limit else pages[offset:]
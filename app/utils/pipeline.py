@@ -0,0 +1,138 @@
+import asyncio
+import time
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable, List, Optional, Union
+
+
+class Stage:
+    """
+    One step of a `Pipeline`: a bounded input queue drained by a pool of workers.
+
+    `handler` is called with one item at a time and returns the items to pass
+    on to the next stage (a list, possibly empty, or None for nothing). Because
+    queues are bounded, a slow stage makes the stages before it wait instead of
+    buffering without limit.
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any], Awaitable[Optional[List[Any]]]],
+                 workers: int = 1, queue_size: int = 100):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.next: Optional["Stage"] = None
+
+        self.processed = 0
+        self.emitted = 0
+        self.busy_time = 0.0
+        self.max_depth = 0
+        self.failed_items: List[Any] = []
+        self._tasks: List[asyncio.Task] = []
+        self._started_at = 0.0
+
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._started_at = time.perf_counter()
+        self._tasks = [asyncio.ensure_future(self._work())
+                       for _ in range(self.workers)]
+
+    async def put(self, item: Any):
+        await self.queue.put(item)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self):
+        while True:
+            item = await self.queue.get()
+            start = time.perf_counter()
+            try:
+                outputs = await self.handler(item)
+                self.processed += 1
+                self.busy_time += time.perf_counter() - start
+                for output in outputs or []:
+                    self.emitted += 1
+                    if self.next:
+                        await self.next.put(output)
+            except Exception as e:
+                self.busy_time += time.perf_counter() - start
+                self.failed_items.append(item)
+                print(f"Error in {self.name} stage: {e}")
+            finally:
+                self.queue.task_done()
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        return {
+            "workers": self.workers,
+            "processed": self.processed,
+            "failed": len(self.failed_items),
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "max_queue_depth": self.max_depth,
+            "throughput": self.processed / elapsed if elapsed else 0.0,
+            "utilisation": self.busy_time / (elapsed * self.workers) if elapsed else 0.0,
+        }
+
+
+class Pipeline:
+    """
+    A chain of stages connected by bounded asyncio queues.
+
+    Every stage runs its own worker pool, so independent resources (browser,
+    LLM, embedding model, database) are kept busy at the same time.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next = next_stage
+
+    async def run(self, source: Union[Iterable[Any], AsyncIterable[Any]], report_interval: float = 0):
+        """
+        Feed `source` into the first stage and wait until every stage is drained.
+
+        Args:
+            source: items for the first stage, a regular or async iterable.
+            report_interval: if set, print stage stats every `report_interval` seconds.
+        """
+        for stage in self.stages:
+            stage.start()
+
+        reporter = asyncio.ensure_future(
+            self._report_periodically(report_interval)) if report_interval else None
+
+        try:
+            if isinstance(source, AsyncIterable):
+                async for item in source:
+                    await self.stages[0].put(item)
+            else:
+                for item in source:
+                    await self.stages[0].put(item)
+
+            # Once a stage's queue is drained all of its outputs have been
+            # handed to the next stage, so draining in order is enough
+            for stage in self.stages:
+                await stage.queue.join()
+        finally:
+            if reporter:
+                reporter.cancel()
+            for stage in self.stages:
+                await stage.stop()
+
+    def stats(self) -> dict:
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def report(self):
+        for name, stats in self.stats().items():
+            print(f"[{name}] processed={stats['processed']} failed={stats['failed']} "
+                  f"queue={stats['queue_depth']}/{stats['max_queue_depth']} "
+                  f"throughput={stats['throughput']:.2f}/s utilisation={stats['utilisation']:.0%}")
+
+    async def _report_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.report()
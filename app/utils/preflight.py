@@ -0,0 +1,205 @@
+import ast
+import os
+import re
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set
+
+from app.utils.venv_pool import normalise_requirements
+
+# Requirements whose import name differs from the project name, beyond a
+# "python-" prefix or "-python" suffix
+IMPORT_NAMES = {
+    "beautifulsoup4": "bs4",
+    "pillow": "PIL",
+    "scikit-learn": "sklearn",
+    "scikit-image": "skimage",
+    "pyyaml": "yaml",
+    "opencv-python": "cv2",
+    "opencv-python-headless": "cv2",
+    "pymupdf": "fitz",
+    "google-api-python-client": "googleapiclient",
+    "attrs": "attr",
+    "pyjwt": "jwt",
+    "psycopg2-binary": "psycopg2",
+    "mysql-connector-python": "mysql",
+    "pycryptodome": "Crypto",
+    "python-telegram-bot": "telegram",
+    "duckduckgo-search": "duckduckgo_search",
+    "pyserial": "serial",
+    "pyzmq": "zmq",
+    "websocket-client": "websocket",
+}
+
+STDLIB_MODULES = set(getattr(sys, "stdlib_module_names", ())) | set(sys.builtin_module_names)
+
+# Usually present in a virtualenv without being declared
+VENV_MODULES = {"pip", "setuptools", "pkg_resources", "_distutils_hack"}
+
+_OPTIONAL_IMPORT_ERRORS = {"ImportError",
+                           "ModuleNotFoundError", "Exception", "BaseException"}
+
+
+def _normalise_name(name: str) -> str:
+    return re.sub(r"[-_.]+", "_", name).lower()
+
+
+def preflight_enabled() -> bool:
+    return os.getenv("EXECUTION_PREFLIGHT", "True").lower() == "true"
+
+
+@dataclass
+class PreflightError:
+    """Why a script was rejected before running it."""
+    kind: str  # "empty" or "syntax"
+    message: str
+    line: Optional[int] = None
+
+    def __str__(self) -> str:
+        location = f" (line {self.line})" if self.line else ""
+        return f"Pre-flight check failed: {self.kind}{location}: {self.message}"
+
+
+def imported_modules(tree: ast.AST) -> Dict[str, int]:
+    """
+    Top level names of the modules a script imports, with the line of their first import.
+
+    Relative imports and imports inside a `try` that handles ImportError are
+    left out, the latter are optional dependencies.
+    """
+    modules: Dict[str, int] = {}
+
+    def visit(node: ast.AST, optional: bool):
+        if isinstance(node, ast.Try):
+            handled = set()
+            for handler in node.handlers:
+                types = handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]
+                handled.update(getattr(type_, "id", None) if type_ is not None else "BaseException"
+                               for type_ in types)
+            for child in node.body:
+                visit(child, optional or bool(handled & _OPTIONAL_IMPORT_ERRORS))
+            for child in node.handlers + node.orelse + node.finalbody:
+                visit(child, optional)
+            return
+
+        if not optional:
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    modules.setdefault(alias.name.split(".")[0], node.lineno)
+            elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+                modules.setdefault(node.module.split(".")[0], node.lineno)
+
+        for child in ast.iter_child_nodes(node):
+            visit(child, optional)
+
+    visit(tree, False)
+    return modules
+
+
+def provided_modules(requirements: Iterable[str]) -> Set[str]:
+    """Normalised import names the requirements are expected to provide."""
+    provided = set()
+    for requirement in normalise_requirements(requirements):
+        name = re.split(r"[^A-Za-z0-9._-]", requirement, maxsplit=1)[0].lower()
+        provided.add(_normalise_name(name))
+        if name in IMPORT_NAMES:
+            provided.add(_normalise_name(IMPORT_NAMES[name]))
+        # python-jose provides jose, tavily-python provides tavily
+        stripped = re.sub(r"^python-|-python$", "", name)
+        if stripped and stripped != name:
+            provided.add(_normalise_name(stripped))
+    return provided
+
+
+def _is_provided(module: str, provided: Set[str]) -> bool:
+    module = _normalise_name(module)
+    # "google" is provided by "google-generativeai", "telegram" by "telegram-bot"...
+    return any(module == name or name.startswith(module + "_") or module.startswith(name + "_")
+               for name in provided)
+
+
+def check_code(code: str) -> Optional[PreflightError]:
+    """
+    Statically check a script before creating an environment and running it.
+
+    Args:
+        code: the Python source.
+
+    Returns:
+        Optional[PreflightError]: why the script cannot run, or None if it parses.
+    """
+    if not code.strip():
+        return PreflightError("empty", "No Python code was found in the response")
+
+    try:
+        ast.parse(code)
+    except SyntaxError as e:
+        text = (e.text or "").rstrip()
+        return PreflightError("syntax", f"{e.msg}: {text}" if text else e.msg, line=e.lineno)
+    return None
+
+
+def undeclared_imports(code: str, requirements: Iterable[str] = ()) -> List[str]:
+    """
+    Third party modules the script imports that no declared requirement seems to provide.
+
+    This is a guess from names only: dependencies of a requirement (numpy
+    with pandas) are importable without being declared, so the result is
+    a warning, not a reason to reject the script.
+    """
+    try:
+        imported = imported_modules(ast.parse(code))
+    except SyntaxError:
+        return []
+    provided = provided_modules(requirements)
+    return sorted((module for module in imported
+                   if module not in STDLIB_MODULES and module not in VENV_MODULES
+                   and not _is_provided(module, provided)), key=imported.get)
+
+
+class PreflightChecker:
+    """
+    Runs `check_code` and counts the executions it short-circuited.
+
+    Undeclared imports are only printed as a warning.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.short_circuited = 0
+        self.warnings = 0
+
+    def check(self, code: str, requirements: Iterable[str] = ()) -> Optional[PreflightError]:
+        error = check_code(code)
+        undeclared = undeclared_imports(code, requirements) if error is None else []
+        with self._lock:
+            self.checked += 1
+            if error:
+                self.short_circuited += 1
+            if undeclared:
+                self.warnings += 1
+        if undeclared:
+            print(f"Pre-flight warning: {', '.join(undeclared)} imported but not declared "
+                  f"in the requirements block")
+        return error
+
+    def stats(self) -> Dict[str, int]:
+        return {"checked": self.checked, "short_circuited": self.short_circuited,
+                "warnings": self.warnings}
+
+
+_checker: Optional[PreflightChecker] = None
+_checker_lock = threading.Lock()
+
+
+def get_preflight_checker() -> PreflightChecker:
+    """Return the shared pre-flight checker, creating it on first use."""
+    global _checker
+
+    if _checker is None:
+        with _checker_lock:
+            if _checker is None:
+                _checker = PreflightChecker()
+    return _checker
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.utils.quantization import pack, unpack
+from app.utils.ttl_cache import TTLCache
+
+# Touched by the ingestion pipeline whenever it writes chunks, so that
+# retrieval caches in other processes know their results are stale
+INDEX_VERSION_FILE = os.getenv("INDEX_VERSION_FILE", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "output", "index_version"))
+
+
+def mark_index_updated(path: str = INDEX_VERSION_FILE):
+    """Record that new chunks were written to the documentation index."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as version_file:
+        version_file.write(str(time.time()))
+
+
+def index_version(path: str = INDEX_VERSION_FILE) -> float:
+    """Return the time the documentation index was last marked as updated."""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+class RetrievalCache:
+    """
+    Caches query embeddings and retrieval results of the documentation RAG tool.
+
+    Query texts map to their embedding, and (embedding, match_count, filter)
+    maps to the rows returned for it. A lookup whose embedding is not cached
+    exactly can still be served from a cached result whose embedding has a
+    cosine similarity of at least `similarity_threshold` (set it above 1 to
+    disable). Results are dropped whenever the ingestion pipeline marks the
+    index as updated. Embeddings are kept packed in the `quantization` format,
+    float16 by default.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600, similarity_threshold: float = 0.97,
+                 version_path: str = INDEX_VERSION_FILE, version_check_interval: float = 5,
+                 quantization: str = "float16"):
+        self.embeddings = TTLCache(max_entries, ttl)
+        self.results = TTLCache(max_entries, ttl)
+        self.similarity_threshold = similarity_threshold
+        self.quantization = quantization
+        self.version_path = version_path
+        self.version_check_interval = version_check_interval
+        self._version = index_version(version_path)
+        self._version_checked_at = time.monotonic()
+        self.semantic_hits = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalise_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def _result_key(self, embedding: List[float], match_count: int, filter: Optional[Dict]) -> str:
+        # Hashing the packed vector gives a fresh embedding and its cached,
+        # quantized copy the same key
+        digest = hashlib.sha256(pack(embedding, self.quantization))
+        digest.update(json.dumps([match_count, filter],
+                      sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = now
+        version = index_version(self.version_path)
+        if version != self._version:
+            self._version = version
+            self.invalidate()
+
+    def invalidate(self):
+        """Drop all cached results, embeddings stay valid."""
+        self.results.clear()
+        self.invalidations += 1
+
+    def get_embedding(self, query: str) -> Optional[List[float]]:
+        packed = self.embeddings.get(self._normalise_query(query))
+        return unpack(packed).tolist() if packed is not None else None
+
+    def put_embedding(self, query: str, embedding: List[float]):
+        self.embeddings.put(self._normalise_query(query),
+                            pack(embedding, self.quantization))
+
+    def get_results(self, embedding: List[float], match_count: int,
+                    filter: Optional[Dict] = None) -> Optional[List[Dict]]:
+        self._check_version()
+
+        entry = self.results.get(self._result_key(
+            embedding, match_count, filter))
+        if entry is not None:
+            return entry["rows"]
+        if self.similarity_threshold > 1:
+            return None
+
+        # Look for a near-duplicate query with the same parameters
+        candidates = [entry for entry in self.results.values()
+                      if entry["match_count"] == match_count and entry["filter"] == filter]
+        if not candidates:
+            return None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        vectors = np.asarray([unpack(entry["embedding"])
+                             for entry in candidates], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+        norms[norms == 0] = 1
+        similarities = vectors @ query / norms
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.similarity_threshold:
+            self.semantic_hits += 1
+            return candidates[best]["rows"]
+        return None
+
+    def put_results(self, embedding: List[float], match_count: int,
+                    filter: Optional[Dict], rows: List[Dict]):
+        self.results.put(self._result_key(embedding, match_count, filter), {
+            "embedding": pack(embedding, self.quantization),
+            "match_count": match_count,
+            "filter": filter,
+            "rows": rows,
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "embeddings": self.embeddings.stats(),
+            "results": self.results.stats(),
+            "semantic_hits": self.semantic_hits,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,263 @@
+import asyncio
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Union
+
+from app.utils.preflight import PreflightError
+from app.utils.venv_pool import InstallReport, RequirementsInstallError, VenvPool, get_venv_pool, venv_python
+from app.utils.warm_workers import WarmWorkerPool, WorkerError, get_worker_pool
+
+# Variables of the parent process a job inherits, everything else it needs
+# has to be passed in its own environment
+PASSTHROUGH_ENV = ("PATH", "LANG", "LC_ALL", "TZ", "SYSTEMROOT",
+                   "HTTP_PROXY", "HTTPS_PROXY", "NO_PROXY")
+
+# Sets the limits given as arguments and then replaces itself with the real
+# command. Jobs are started from pool threads, where a preexec_fn is not safe.
+LIMITS_LAUNCHER = """\
+import os, resource, sys
+cpu_seconds, memory = int(sys.argv[1]), int(sys.argv[2])
+if cpu_seconds:
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+if memory:
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+os.execv(sys.executable, [sys.executable] + sys.argv[3:])
+"""
+
+
+@dataclass
+class ExecutionResult:
+    returncode: Optional[int]
+    stdout: str = ""
+    stderr: str = ""
+    error: str = ""
+    duration: float = 0.0
+    timed_out: bool = False
+    install: Optional[InstallReport] = None
+    warm: bool = False
+    cancelled: bool = False
+    dropped_output: int = 0
+    cached: bool = False
+    preflight: Optional[PreflightError] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+
+@dataclass
+class SandboxLimits:
+    """Per-job limits, None disables a limit."""
+    timeout: Optional[float] = 300
+    cpu_seconds: Optional[int] = 300
+    memory_mb: Optional[int] = 2048
+
+    @classmethod
+    def from_env(cls) -> "SandboxLimits":
+        def optional(name: str, default: str):
+            value = os.getenv(name, default)
+            return int(value) if value and value != "0" else None
+
+        return cls(timeout=optional("EXECUTION_TIMEOUT", "300"),
+                   cpu_seconds=optional("EXECUTION_CPU_SECONDS", "300"),
+                   memory_mb=optional("EXECUTION_MEMORY_MB", "2048"))
+
+
+def job_environment(env_vars: Union[Dict[str, str], Iterable[str], None], home: str) -> Dict[str, str]:
+    """
+    Build the environment of a job.
+
+    Args:
+        env_vars: a mapping, or "KEY=VALUE" lines. A variable without a value
+            is taken from this process, so generated code can name the
+            variables it needs without the agent knowing their values.
+        home: the job directory, used as HOME and TMPDIR.
+
+    Returns:
+        Dict[str, str]: the variables to run the job with.
+    """
+    env = {name: os.environ[name] for name in PASSTHROUGH_ENV if name in os.environ}
+    env.update({"HOME": home, "TMPDIR": home, "TEMP": home, "TMP": home,
+                "PYTHONDONTWRITEBYTECODE": "1"})
+
+    if isinstance(env_vars, dict):
+        items = env_vars.items()
+    else:
+        items = [line.split("=", 1) if "=" in line else (line, "")
+                 for line in (env_vars or []) if line.strip()]
+
+    for name, value in items:
+        name, value = name.strip(), value.strip()
+        if not value:
+            value = os.environ.get(name)
+        if name and value is not None:
+            env[name] = value
+    return env
+
+
+def warm_workers_enabled() -> bool:
+    """Warm workers fork per job, so they are only used where fork is available."""
+    return hasattr(os, "fork") and os.getenv("EXECUTION_WARM_WORKERS", "True").lower() == "true"
+
+
+def limited_command(python: str, args: List[str], limits: SandboxLimits) -> List[str]:
+    """
+    Command running `python` with `args` under the CPU and memory limits of `limits`.
+
+    On POSIX the interpreter first runs `LIMITS_LAUNCHER`, which sets the
+    limits and execs the real command, so the script's own process and
+    tracebacks are unchanged.
+    """
+    if os.name != "posix":
+        return [python, *args]
+    return [python, "-S", "-c", LIMITS_LAUNCHER, str(limits.cpu_seconds or 0),
+            str((limits.memory_mb or 0) * 2**20), *args]
+
+
+def run_sandboxed(code: str, requirements: Iterable[str] = (),
+                  env_vars: Union[Dict[str, str], Iterable[str], None] = None,
+                  limits: Optional[SandboxLimits] = None, venv_path: Optional[str] = None,
+                  venv_pool: Optional[VenvPool] = None,
+                  workers: Optional[WarmWorkerPool] = None) -> ExecutionResult:
+    """
+    Run a Python script in its own temporary directory and environment.
+
+    The script runs with the virtualenv for its requirements, the job
+    directory as working directory and HOME, only the variables from
+    `job_environment`, and the CPU and memory limits of `limits` (on POSIX).
+    The directory is deleted afterwards. With `workers` the script runs in a
+    child forked from a warm worker of the virtualenv instead of a new
+    interpreter, falling back to a new interpreter if the worker crashes.
+
+    Args:
+        code: the Python source to run.
+        requirements: requirement lines the script needs.
+        env_vars: variables for the script, see `job_environment`.
+        limits: timeout and resource limits.
+        venv_path: a virtualenv to use instead of one from the pool.
+        venv_pool: the pool to take the virtualenv from, the shared one by default.
+        workers: warm workers to run the script on.
+
+    Returns:
+        ExecutionResult: exit status, output and timings of the run.
+    """
+    limits = limits or SandboxLimits.from_env()
+    lease = (venv_pool or get_venv_pool()).acquire(requirements) if venv_path is None \
+        else nullcontext(venv_path)
+    start = time.perf_counter()
+
+    try:
+        with lease as venv_path, tempfile.TemporaryDirectory(prefix="user_code_exec_") as job_dir:
+            script_path = os.path.join(job_dir, "user_script.py")
+            with open(script_path, "w") as script_file:
+                script_file.write(code)
+            env = job_environment(env_vars, job_dir)
+
+            if workers is not None:
+                try:
+                    output = workers.run(venv_path, script_path, job_dir, env, limits.timeout,
+                                         limits.cpu_seconds, limits.memory_mb)
+                    return ExecutionResult(
+                        returncode=output["returncode"], stdout=output["stdout"], stderr=output["stderr"],
+                        error=f"Script timed out after {limits.timeout}s" if output["timed_out"] else "",
+                        timed_out=output["timed_out"], duration=time.perf_counter() - start,
+                        install=getattr(lease, "report", None), warm=True)
+                except WorkerError as e:
+                    print(f"Warm worker failed, running in a new interpreter: {e}")
+
+            try:
+                completed = subprocess.run(
+                    limited_command(venv_python(venv_path), [script_path], limits), cwd=job_dir,
+                    env=env, capture_output=True, text=True,
+                    timeout=limits.timeout)
+            except subprocess.TimeoutExpired as e:
+                return ExecutionResult(
+                    returncode=None, stdout=_text(e.stdout), stderr=_text(e.stderr),
+                    error=f"Script timed out after {limits.timeout}s", timed_out=True,
+                    duration=time.perf_counter() - start, install=getattr(lease, "report", None))
+
+            return ExecutionResult(
+                returncode=completed.returncode, stdout=completed.stdout, stderr=completed.stderr,
+                duration=time.perf_counter() - start, install=getattr(lease, "report", None))
+
+    except (RequirementsInstallError, subprocess.CalledProcessError) as e:
+        # A failed install, or a virtualenv that could not be created
+        return ExecutionResult(returncode=None, error=str(e), duration=time.perf_counter() - start)
+
+
+def _text(output: Union[str, bytes, None]) -> str:
+    if isinstance(output, bytes):
+        return output.decode("utf-8", errors="replace")
+    return output or ""
+
+
+class ExecutionPool:
+    """
+    Runs up to `max_workers` sandboxed scripts at the same time.
+
+    `submit` returns an asyncio future, so an agent can validate several
+    candidate programs concurrently and await them together.
+    """
+
+    def __init__(self, max_workers: int = 4, limits: Optional[SandboxLimits] = None,
+                 venv_pool: Optional[VenvPool] = None, workers: Optional[WarmWorkerPool] = None):
+        self.limits = limits or SandboxLimits.from_env()
+        self.venv_pool = venv_pool
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="execution")
+        self.submitted = 0
+        self.failed = 0
+        self.timed_out = 0
+
+    def run(self, code: str, requirements: Iterable[str] = (),
+            env_vars: Union[Dict[str, str], Iterable[str], None] = None) -> ExecutionResult:
+        """Run a script on the calling thread with the pool's limits."""
+        result = run_sandboxed(code, list(requirements), env_vars, self.limits,
+                               venv_pool=self.venv_pool, workers=self.workers)
+        if not result.ok:
+            self.failed += 1
+        if result.timed_out:
+            self.timed_out += 1
+        return result
+
+    def submit(self, code: str, requirements: Iterable[str] = (),
+               env_vars: Union[Dict[str, str], Iterable[str], None] = None) -> "asyncio.Future[ExecutionResult]":
+        """
+        Queue a script and return a future of its `ExecutionResult`.
+
+        Must be called from a running event loop.
+        """
+        self.submitted += 1
+        return asyncio.get_running_loop().run_in_executor(
+            self._executor, self.run, code, list(requirements), env_vars)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, int]:
+        return {"submitted": self.submitted, "failed": self.failed, "timed_out": self.timed_out}
+
+
+_pool: Optional[ExecutionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_execution_pool() -> ExecutionPool:
+    """Return the shared execution pool, sized with `EXECUTION_WORKERS`."""
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ExecutionPool(
+                    max_workers=int(os.getenv("EXECUTION_WORKERS", "4")),
+                    workers=get_worker_pool() if warm_workers_enabled() else None)
+    return _pool
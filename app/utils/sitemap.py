@@ -0,0 +1,99 @@
+import asyncio
+from typing import AsyncIterator, Optional, Set, Tuple
+from xml.etree import ElementTree
+
+import httpx
+
+_DONE = object()
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _child_text(element, name: str) -> Optional[str]:
+    for child in element:
+        if _local_name(child.tag) == name and child.text:
+            return child.text.strip()
+    return None
+
+
+async def iter_sitemap(sitemap_url: str, client: Optional[httpx.AsyncClient] = None,
+                       max_concurrent: int = 4, queue_size: int = 1000) -> AsyncIterator[Tuple[str, Optional[str]]]:
+    """
+    Stream (URL, <lastmod>) pairs out of a sitemap while it is being downloaded.
+
+    The body is fed chunk by chunk into an incremental XML parser, so URLs are
+    yielded as soon as their `<url>` element is complete. Child sitemaps listed
+    in a `<sitemapindex>` are fetched concurrently (at most `max_concurrent` at
+    a time) and their URLs are interleaved into the same stream.
+
+    Args:
+        sitemap_url: URL of a sitemap or sitemap index.
+        client: optional shared HTTP client.
+        max_concurrent: maximum number of sitemaps downloaded at the same time.
+        queue_size: maximum number of parsed URLs buffered ahead of the consumer.
+
+    Yields:
+        Tuple[str, Optional[str]]: the page URL and its `<lastmod>`, None when absent.
+    """
+
+    own_client = client is None
+    if own_client:
+        client = httpx.AsyncClient(follow_redirects=True, timeout=30)
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    semaphore = asyncio.Semaphore(max_concurrent)
+    visited: Set[str] = set()
+    tasks = set()
+    active = 0
+
+    def spawn(url: str):
+        nonlocal active
+        if url in visited:
+            return
+        visited.add(url)
+        active += 1
+        task = asyncio.ensure_future(parse(url))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def parse(url: str):
+        try:
+            async with semaphore:
+                parser = ElementTree.XMLPullParser(events=("end",))
+                async with client.stream("GET", url) as response:
+                    response.raise_for_status()
+                    async for data in response.aiter_bytes():
+                        parser.feed(data)
+                        for _, element in parser.read_events():
+                            name = _local_name(element.tag)
+                            if name == "url":
+                                loc = _child_text(element, "loc")
+                                if loc:
+                                    await queue.put((loc, _child_text(element, "lastmod")))
+                                element.clear()
+                            elif name == "sitemap":
+                                loc = _child_text(element, "loc")
+                                if loc:
+                                    spawn(loc)
+                                element.clear()
+                parser.close()
+        except Exception as e:
+            print(f"Error fetching sitemap {url}: {e}")
+        finally:
+            await queue.put(_DONE)
+
+    try:
+        spawn(sitemap_url)
+        while active:
+            item = await queue.get()
+            if item is _DONE:
+                active -= 1
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        if own_client:
+            await client.aclose()
@@ -0,0 +1,68 @@
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+IMPORT_TIME_PATTERN = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)")
+
+
+def parse_import_times(output: str) -> List[Tuple[str, int, int, int]]:
+    """
+    Parse the `python -X importtime` report.
+
+    Returns:
+        List[Tuple[str, int, int, int]]: (module, self us, cumulative us, nesting level) per import.
+    """
+    imports = []
+    for line in output.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match:
+            imports.append((match.group(4), int(match.group(1)), int(match.group(2)),
+                            (len(match.group(3)) - 1) // 2))
+    return imports
+
+
+def profile_startup(script_path: str, top: int = 15) -> Dict[str, float]:
+    """
+    Import the module at `script_path` in a fresh interpreter and report where the time goes.
+
+    The module is imported as its importers do (`import pydantic_ai_expert`
+    with its directory on the path) under `-X importtime`, so the report
+    covers a cold start without running the module's `main`.
+
+    Args:
+        script_path: path of the module to profile.
+        top: number of packages to list.
+
+    Returns:
+        Dict[str, float]: wall-clock seconds and the import seconds per top level package.
+    """
+    directory, module = os.path.split(os.path.abspath(script_path))
+    module = os.path.splitext(module)[0]
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         f"import sys; sys.path.insert(0, {directory!r}); import {module}"],
+        capture_output=True, text=True)
+    wall = time.perf_counter() - start
+
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        print(f"Importing {module} failed")
+
+    packages: Dict[str, int] = defaultdict(int)
+    for name, self_us, _, _ in parse_import_times(result.stderr):
+        packages[name.split(".")[0]] += self_us
+
+    print(f"Startup of {module}: {wall:.2f}s wall clock, "
+          f"{sum(packages.values()) / 1e6:.2f}s in imports")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {package:<30} {self_us / 1e6:>7.3f}s")
+
+    report = {package: self_us / 1e6 for package, self_us in packages.items()}
+    report["wall_clock"] = wall
+    return report
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import random
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+# (column, operator, value), e.g. ("url", "eq", url) or ("chunk_number", "gte", 3)
+Filter = Tuple[str, str, Any]
+
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class SupabaseError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Supabase request failed with {status_code}: {message}")
+        self.status_code = status_code
+
+
+class SupabaseDAL:
+    """
+    Async data access layer over the Supabase REST (PostgREST) API.
+
+    All requests share one pooled `httpx.AsyncClient`, run under a
+    concurrency limit and are retried with exponential backoff and full
+    jitter on connection errors, timeouts and retryable status codes. This
+    keeps database calls off the event loop so that ingestion writes and
+    agent tool calls can run concurrently.
+    """
+
+    def __init__(self, url: str, key: str, max_connections: int = 20, timeout: float = 30,
+                 max_retries: int = 3, max_concurrency: int = 10, backoff: float = 0.5):
+        if not url or not key:
+            raise ValueError("Supabase URL and key are required")
+
+        self.base_url = url.rstrip("/") + "/rest/v1"
+        self.key = key
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.backoff = backoff
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        self.requests = 0
+        self.retries = 0
+
+    def _ensure_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"apikey": self.key, "Authorization": f"Bearer {self.key}"},
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections))
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def _filter_params(filters: Sequence[Filter]) -> List[Tuple[str, str]]:
+        return [(column, f"{operator}.{value}") for column, operator, value in filters]
+
+    async def _request(self, method: str, path: str, params=None, json=None,
+                       headers: Optional[Dict[str, str]] = None) -> Any:
+        self._ensure_client()
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    self.requests += 1
+                    response = await self._client.request(method, path, params=params,
+                                                          json=json, headers=headers)
+                if response.status_code < 400:
+                    return response.json() if response.content else None
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    raise SupabaseError(response.status_code, response.text)
+            except (httpx.TransportError, httpx.TimeoutException):
+                if attempt == self.max_retries:
+                    raise
+
+            self.retries += 1
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    async def rpc(self, function: str, params: Dict[str, Any]) -> Any:
+        """Call a Postgres function, e.g. `match_site_pages`."""
+        return await self._request("POST", f"/rpc/{function}", json=params)
+
+    async def select(self, table: str, columns: str = "*", filters: Sequence[Filter] = (),
+                     order: Optional[str] = None, limit: Optional[int] = None,
+                     offset: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Select rows from a table.
+
+        Args:
+            table: the table name.
+            columns: the PostgREST select list, e.g. "title, content".
+            filters: (column, operator, value) conditions, columns may be JSON paths like "metadata->>source".
+            order: column to order by, append ".desc" for descending order.
+            limit: maximum number of rows.
+            offset: number of rows to skip.
+
+        Returns:
+            List[Dict[str, Any]]: the selected rows.
+        """
+        params = [("select", columns.replace(" ", ""))] + \
+            self._filter_params(filters)
+        if order:
+            params.append(("order", order))
+        if limit is not None:
+            params.append(("limit", str(limit)))
+        if offset is not None:
+            params.append(("offset", str(offset)))
+        return await self._request("GET", f"/{table}", params=params) or []
+
+    async def select_all(self, table: str, columns: str = "*", filters: Sequence[Filter] = (),
+                         order: str = "id", page_size: int = 1000) -> List[Dict[str, Any]]:
+        """Select every matching row, a page at a time."""
+        rows = []
+        while True:
+            page = await self.select(table, columns, filters, order=order,
+                                     limit=page_size, offset=len(rows))
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+
+    async def upsert(self, table: str, rows: List[Dict[str, Any]], on_conflict: str) -> None:
+        """Insert rows, updating the existing ones that conflict on `on_conflict`."""
+        await self._request("POST", f"/{table}", params={"on_conflict": on_conflict}, json=rows,
+                            headers={"Prefer": "resolution=merge-duplicates,return=minimal"})
+
+    async def delete(self, table: str, filters: Sequence[Filter]) -> None:
+        """Delete the rows matching every filter."""
+        if not filters:
+            raise ValueError("Refusing to delete without filters")
+        await self._request("DELETE", f"/{table}", params=self._filter_params(filters),
+                            headers={"Prefer": "return=minimal"})
+
+    def stats(self) -> Dict[str, int]:
+        return {"requests": self.requests, "retries": self.retries}
+
+
+_dal: Optional[SupabaseDAL] = None
+
+
+def get_dal() -> SupabaseDAL:
+    """Return the shared data access layer configured from the environment."""
+    global _dal
+
+    if _dal is None:
+        _dal = SupabaseDAL(
+            os.getenv("SUPABASE_URL"),
+            os.getenv("SUPABASE_SERVICE_KEY"),
+            max_connections=int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20")),
+            timeout=float(os.getenv("SUPABASE_TIMEOUT", "30")),
+            max_retries=int(os.getenv("SUPABASE_RETRIES", "3")),
+            max_concurrency=int(os.getenv("SUPABASE_CONCURRENCY", "10"))
+        )
+    return _dal
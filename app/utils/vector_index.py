@@ -0,0 +1,221 @@
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.utils.quantization import quantize
+
+# Below this many rows every query is a brute-force scan, above it an IVF
+# (inverted file) index narrows the scan down to the closest clusters
+IVF_THRESHOLD = int(os.getenv("LOCAL_INDEX_IVF_THRESHOLD", "20000"))
+
+# Storage format of the vectors, "float16" and "int8" cut the index size
+# (and the memory it pages in) by 2x and 4x at a small cost in recall
+QUANTIZATION = os.getenv("LOCAL_INDEX_QUANTIZATION", "float32")
+
+ROW_COLUMNS = ["id", "url", "chunk_number", "title",
+               "summary", "content", "metadata"]
+
+
+def metadata_contains(metadata: Any, filter: Any) -> bool:
+    """Python equivalent of the jsonb `metadata @> filter` check used by `match_site_pages`."""
+    if isinstance(filter, dict):
+        return isinstance(metadata, dict) and all(
+            key in metadata and metadata_contains(metadata[key], value)
+            for key, value in filter.items())
+    if isinstance(filter, list):
+        return isinstance(metadata, list) and all(
+            any(metadata_contains(item, value) for item in metadata)
+            for value in filter)
+    return metadata == filter
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def _kmeans(vectors: np.ndarray, clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    # Spherical k-means on (a sample of) normalised vectors
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(
+        len(vectors), clusters * 64), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=clusters, replace=False)]
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        for cluster in range(clusters):
+            members = sample[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+        centroids = _normalise(centroids)
+    return centroids.astype(np.float32)
+
+
+class LocalVectorIndex:
+    """
+    In-process vector index over `site_pages` rows.
+
+    Vectors are stored normalised in a `.npy` file that is memory-mapped on
+    load, so opening the index is cheap and the OS pages vectors in on demand.
+    They can be stored as float16 or as int8 with a per-vector scale.
+    Small corpora are searched by brute force, larger ones through an IVF
+    index built with k-means. `match` returns the same rows and similarity
+    as the `match_site_pages` RPC, with the same `filter` semantics.
+    """
+
+    def __init__(self, directory: str, vectors: np.ndarray, rows: List[Dict[str, Any]],
+                 centroids: Optional[np.ndarray] = None, order: Optional[np.ndarray] = None,
+                 offsets: Optional[np.ndarray] = None, nprobe: int = 8,
+                 scales: Optional[np.ndarray] = None):
+        self.directory = directory
+        self.vectors = vectors
+        self.scales = scales
+        self.rows = rows
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, rows: List[Dict[str, Any]], directory: str,
+              quantization: str = QUANTIZATION) -> "LocalVectorIndex":
+        """
+        Build an index from `site_pages` rows and persist it to `directory`.
+
+        Args:
+            rows: rows with the `site_pages` columns, including `embedding`.
+            directory: where to store the index files.
+            quantization: "float32", "float16" or "int8".
+
+        Returns:
+            LocalVectorIndex: the index, loaded from the files just written.
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        embeddings = [json.loads(row["embedding"]) if isinstance(row["embedding"], str) else row["embedding"]
+                      for row in rows]
+        vectors = _normalise(np.asarray(embeddings, dtype=np.float32)) if rows \
+            else np.zeros((0, 0), dtype=np.float32)
+        codes, scales = quantize(vectors, quantization)
+        np.save(os.path.join(directory, "vectors.npy"), codes)
+        scales_path = os.path.join(directory, "scales.npy")
+        if scales is not None:
+            np.save(scales_path, scales)
+        elif os.path.exists(scales_path):
+            os.remove(scales_path)
+
+        with open(os.path.join(directory, "rows.json"), "w") as rows_file:
+            json.dump([{column: row.get(column) for column in ROW_COLUMNS} for row in rows],
+                      rows_file)
+
+        ivf_path = os.path.join(directory, "ivf.npz")
+        if len(rows) >= IVF_THRESHOLD:
+            clusters = int(np.sqrt(len(rows)))
+            centroids = _kmeans(vectors, clusters)
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            order = np.argsort(assignments, kind="stable")
+            offsets = np.searchsorted(
+                assignments[order], np.arange(clusters + 1))
+            np.savez(ivf_path, centroids=centroids,
+                     order=order, offsets=offsets)
+        elif os.path.exists(ivf_path):
+            os.remove(ivf_path)
+
+        print(
+            f"Built local vector index of {len(rows)} chunks ({quantization}, {codes.nbytes / 2**20:.1f} MB) in {directory}")
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory: str) -> "LocalVectorIndex":
+        vectors = np.load(os.path.join(
+            directory, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "rows.json"), "r") as rows_file:
+            rows = json.load(rows_file)
+        scales_path = os.path.join(directory, "scales.npy")
+        scales = np.load(scales_path) if os.path.exists(scales_path) else None
+
+        centroids = order = offsets = None
+        ivf_path = os.path.join(directory, "ivf.npz")
+        if os.path.exists(ivf_path):
+            ivf = np.load(ivf_path)
+            centroids, order, offsets = ivf["centroids"], ivf["order"], ivf["offsets"]
+
+        return cls(directory, vectors, rows, centroids, order, offsets,
+                   nprobe=int(os.getenv("LOCAL_INDEX_NPROBE", "8")), scales=scales)
+
+    def _candidates(self, query: np.ndarray, nprobe: int) -> Optional[np.ndarray]:
+        if self.centroids is None or nprobe >= len(self.centroids):
+            return None
+        closest = np.argsort(-(self.centroids @ query))[:nprobe]
+        return np.concatenate([self.order[self.offsets[cluster]:self.offsets[cluster + 1]]
+                               for cluster in closest])
+
+    def match(self, query_embedding: List[float], match_count: int = 10,
+              filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Local equivalent of the `match_site_pages` RPC.
+
+        Args:
+            query_embedding: the query vector.
+            match_count: number of rows to return.
+            filter: metadata the rows must contain.
+
+        Returns:
+            List[Dict[str, Any]]: the closest rows, with their cosine `similarity`.
+        """
+        if not self.rows:
+            return []
+
+        query = _normalise(np.asarray(query_embedding, dtype=np.float32))
+        nprobe = self.nprobe
+
+        while True:
+            candidates = self._candidates(query, nprobe)
+            if candidates is None:
+                candidates = np.arange(len(self.rows))
+            if filter:
+                candidates = np.array([i for i in candidates
+                                       if metadata_contains(self.rows[i]["metadata"], filter)], dtype=np.int64)
+
+            # Probe more clusters until enough rows pass the filter
+            if len(candidates) >= match_count or self.centroids is None or nprobe >= len(self.centroids):
+                break
+            nprobe *= 2
+
+        if not len(candidates):
+            return []
+
+        scores = np.asarray(self.vectors[candidates] @ query, dtype=np.float32)
+        if self.scales is not None:
+            scores *= self.scales[candidates]
+        count = min(match_count, len(candidates))
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top])]
+
+        return [dict(self.rows[candidates[i]], similarity=float(scores[i])) for i in top]
+
+    def select(self, filter: Optional[Dict[str, Any]] = None, url: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return the rows matching `filter` (and `url` if given), ordered by URL and chunk number."""
+        rows = [row for row in self.rows
+                if (url is None or row["url"] == url)
+                and (not filter or metadata_contains(row["metadata"], filter))]
+        return sorted(rows, key=lambda row: (row["url"], row["chunk_number"]))
+
+
+if __name__ == "__main__":
+    import asyncio
+    from app.utils.supabase_dal import get_dal
+
+    async def fetch_site_pages() -> List[Dict[str, Any]]:
+        dal = get_dal()
+        try:
+            return await dal.select_all("site_pages", ", ".join(ROW_COLUMNS + ["embedding"]))
+        finally:
+            await dal.close()
+
+    directory = sys.argv[1] if len(sys.argv) > 1 else os.getenv(
+        "LOCAL_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "output", "vector_index"))
+    LocalVectorIndex.build(asyncio.run(fetch_site_pages()), directory)
@@ -0,0 +1,356 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+READY_FILE = ".ready"
+
+_NAME_PATTERN = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)(.*)$")
+
+
+def normalise_requirements(requirements: Iterable[str]) -> List[str]:
+    """
+    Return a canonical, sorted list of requirement lines.
+
+    Comments, blank lines and whitespace are dropped and project names are
+    normalised as in PEP 503, so "Requests >= 2", "requests>=2" and
+    "requests>=2  # http" all count as the same requirement.
+    """
+    normalised = set()
+    for line in requirements:
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        line = "".join(line.split())
+        match = _NAME_PATTERN.match(line)
+        if match:
+            line = re.sub(r"[-_.]+", "-", match.group(1)).lower() + match.group(2)
+        normalised.add(line)
+    return sorted(normalised)
+
+
+def requirements_key(requirements: Iterable[str]) -> str:
+    """Hash of the normalised requirements and the Python version they are installed for."""
+    digest = hashlib.sha256(
+        f"{sys.version_info.major}.{sys.version_info.minor}".encode("utf-8"))
+    for requirement in normalise_requirements(requirements):
+        digest.update(b"\n" + requirement.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class RequirementsInstallError(Exception):
+    """pip could not install a requirement set, the message ends with pip's output."""
+
+
+@dataclass
+class InstallReport:
+    """How the virtualenv of one execution was obtained."""
+    key: str
+    reused: bool = False
+    seconds: float = 0.0
+    packages: int = 0
+    cached_wheels: int = 0
+    offline: bool = False
+
+    @property
+    def cache_hit_rate(self) -> float:
+        if self.reused:
+            return 1.0
+        return self.cached_wheels / self.packages if self.packages else 1.0
+
+    def __str__(self) -> str:
+        if self.reused:
+            return f"reused environment {self.key}, no install"
+        return (f"installed {self.packages} packages into {self.key} in {self.seconds:.1f}s, "
+                f"{self.cached_wheels} from the wheelhouse ({self.cache_hit_rate:.0%} hit rate"
+                f"{', offline' if self.offline else ''})")
+
+
+def venv_python(venv_path: str) -> str:
+    return os.path.join(venv_path, "Scripts" if os.name == "nt" else "bin", "python")
+
+
+def _disk_size(path: str) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+class VenvPool:
+    """
+    Pool of virtualenvs, one per distinct set of requirements.
+
+    A virtualenv is built the first time its requirement set is seen, into
+    a temporary directory that is renamed into place once it is complete,
+    so concurrent executions (in this or other processes) never see a half
+    built environment. Later executions with the same requirements reuse it
+    without installing anything. When the pool grows beyond `max_bytes`, the
+    least recently used environments are deleted.
+
+    Environments are always driven through their `python` (`python -m pip`),
+    which keeps working after the rename.
+
+    Requirements are installed in a single pip run from a local wheelhouse.
+    An install is first tried offline from the wheelhouse alone. Only when
+    that fails are the missing wheels downloaded or built into it with one
+    `pip wheel` run, so previously seen packages never touch the network.
+    """
+
+    def __init__(self, root: str = ".venv_pool", max_bytes: int = 5 * 2**30,
+                 python: str = sys.executable, wheelhouse: str = ".wheelhouse"):
+        self.root = os.path.abspath(root)
+        self.wheelhouse = os.path.abspath(wheelhouse)
+        self.max_bytes = max_bytes
+        self.python = python
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._in_use: Dict[str, int] = {}
+
+        self.hits = 0
+        self.builds = 0
+        self.evictions = 0
+
+        os.makedirs(self.root, exist_ok=True)
+        os.makedirs(self.wheelhouse, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def is_ready(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.path(key), READY_FILE))
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, requirements: Iterable[str]) -> str:
+        """
+        Return a virtualenv with `requirements` installed, building it if needed.
+
+        Args:
+            requirements: requirement lines as found in requirements.txt.
+
+        Returns:
+            str: the path of the virtualenv.
+        """
+        return self.get_with_report(requirements)[0]
+
+    def get_with_report(self, requirements: Iterable[str]) -> Tuple[str, InstallReport]:
+        """Like `get`, also returning how long installing took and how much came from the wheelhouse."""
+        requirements = normalise_requirements(requirements)
+        key = requirements_key(requirements)
+
+        with self._key_lock(key):
+            if self.is_ready(key):
+                self.hits += 1
+                report = InstallReport(key=key, reused=True)
+            else:
+                report = self._build(key, requirements)
+            # Marks the environment as recently used
+            os.utime(os.path.join(self.path(key), READY_FILE))
+
+        print(f"Virtual environment: {report}")
+        self.evict(keep=key)
+        return self.path(key), report
+
+    def acquire(self, requirements: Iterable[str]) -> "_Lease":
+        """Like `get`, but protects the environment from eviction until the lease is released."""
+        return _Lease(self, requirements)
+
+    def prebuild(self, requirement_sets: Iterable[Iterable[str]]) -> threading.Thread:
+        """Build the virtualenvs for `requirement_sets` on a background thread."""
+        requirement_sets = [list(requirements) for requirements in requirement_sets]
+
+        def run():
+            for requirements in requirement_sets:
+                try:
+                    self.get(requirements)
+                except Exception as e:
+                    print(f"Error prebuilding virtual environment for {requirements}: {e}")
+
+        thread = threading.Thread(target=run, name="venv-prebuild", daemon=True)
+        thread.start()
+        return thread
+
+    def _build(self, key: str, requirements: List[str]) -> InstallReport:
+        start = time.perf_counter()
+        building = os.path.join(self.root, f".{key}.{uuid.uuid4().hex}")
+        print(f"Creating virtual environment {key}...")
+
+        try:
+            subprocess.check_call([self.python, "-m", "venv", building])
+            report = self._install(building, requirements)
+            report.key = key
+
+            with open(os.path.join(building, READY_FILE), "w") as ready_file:
+                json.dump({"requirements": requirements,
+                           "size": _disk_size(building)}, ready_file)
+
+            try:
+                os.rename(building, self.path(key))
+            except OSError:
+                # Another process built the same environment first
+                if not self.is_ready(key):
+                    raise
+        finally:
+            if os.path.exists(building):
+                shutil.rmtree(building, ignore_errors=True)
+
+        self.builds += 1
+        print(f"Created virtual environment {key} in {time.perf_counter() - start:.1f}s")
+        return report
+
+    def _pip(self, venv_path: str, *args: str) -> subprocess.CompletedProcess:
+        return subprocess.run([venv_python(venv_path), "-m", "pip", *args, "--disable-pip-version-check"],
+                              capture_output=True, text=True)
+
+    def _install(self, venv_path: str, requirements: List[str]) -> InstallReport:
+        report = InstallReport(key="")
+        if not requirements:
+            return report
+
+        start = time.perf_counter()
+        requirements_path = os.path.join(venv_path, "requirements.txt")
+        with open(requirements_path, "w") as requirements_file:
+            requirements_file.write("\n".join(requirements) + "\n")
+        install_report_path = os.path.join(venv_path, "install-report.json")
+        install = ["install", "--no-index", "--find-links", self.wheelhouse,
+                   "-r", requirements_path, "--report", install_report_path]
+
+        wheels_before = set(os.listdir(self.wheelhouse))
+        result = self._pip(venv_path, *install)
+        report.offline = result.returncode == 0
+
+        if not report.offline:
+            # Fetch or build whatever the wheelhouse is missing, then install from it
+            result = self._pip(venv_path, "wheel", "--wheel-dir", self.wheelhouse,
+                               "--find-links", self.wheelhouse, "-r", requirements_path)
+            if result.returncode == 0:
+                result = self._pip(venv_path, *install)
+        if result.returncode != 0:
+            raise RequirementsInstallError(
+                f"Installing {', '.join(requirements)} failed:\n{(result.stderr or result.stdout)[-2000:]}")
+
+        try:
+            with open(install_report_path, "r") as install_report_file:
+                report.packages = len(json.load(install_report_file).get("install", []))
+        except (OSError, ValueError):
+            report.packages = len(requirements)
+        added = len(set(os.listdir(self.wheelhouse)) - wheels_before)
+        report.cached_wheels = max(report.packages - added, 0)
+        report.seconds = time.perf_counter() - start
+        return report
+
+    def _entries(self) -> List[Dict]:
+        entries = []
+        for key in os.listdir(self.root):
+            if key.startswith("."):  # Still being built
+                continue
+            ready_path = os.path.join(self.path(key), READY_FILE)
+            try:
+                with open(ready_path, "r") as ready_file:
+                    size = json.load(ready_file).get("size", 0)
+                entries.append({"key": key, "size": size,
+                                "last_used": os.path.getmtime(ready_path)})
+            except (OSError, ValueError):
+                continue
+        return entries
+
+    def evict(self, keep: Optional[str] = None):
+        """Delete least recently used virtualenvs until the pool fits in `max_bytes`."""
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry["last_used"])
+            total = sum(entry["size"] for entry in entries)
+
+            for entry in entries:
+                if total <= self.max_bytes:
+                    break
+                if entry["key"] == keep or self._in_use.get(entry["key"]):
+                    continue
+                shutil.rmtree(self.path(entry["key"]), ignore_errors=True)
+                total -= entry["size"]
+                self.evictions += 1
+                print(f"Evicted virtual environment {entry['key']} ({entry['size'] / 2**20:.0f} MB)")
+
+    def stats(self) -> Dict[str, float]:
+        entries = self._entries()
+        lookups = self.hits + self.builds
+        return {
+            "environments": len(entries),
+            "size_mb": sum(entry["size"] for entry in entries) / 2**20,
+            "hits": self.hits,
+            "builds": self.builds,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class _Lease:
+    def __init__(self, pool: VenvPool, requirements: Iterable[str]):
+        self.pool = pool
+        self.requirements = list(requirements)
+        self.key = requirements_key(self.requirements)
+        self.report: Optional[InstallReport] = None
+
+    def __enter__(self) -> str:
+        with self.pool._lock:
+            self.pool._in_use[self.key] = self.pool._in_use.get(self.key, 0) + 1
+        try:
+            path, self.report = self.pool.get_with_report(self.requirements)
+            return path
+        except Exception:
+            self.__exit__()
+            raise
+
+    def __exit__(self, *exc_info):
+        with self.pool._lock:
+            self.pool._in_use[self.key] -= 1
+            if not self.pool._in_use[self.key]:
+                del self.pool._in_use[self.key]
+
+
+_pool: Optional[VenvPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_venv_pool() -> VenvPool:
+    """
+    Return the shared virtualenv pool, creating it on first use.
+
+    Configured with `VENV_POOL_DIR`, `VENV_POOL_MAX_MB` and `WHEELHOUSE_DIR`.
+    """
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = VenvPool(
+                    root=os.getenv("VENV_POOL_DIR", ".venv_pool"),
+                    max_bytes=int(os.getenv("VENV_POOL_MAX_MB", "5120")) * 2**20,
+                    wheelhouse=os.getenv("WHEELHOUSE_DIR", ".wheelhouse")
+                )
+    return _pool
+
+
+if __name__ == "__main__":
+    # Build the environments for the given requirements files ahead of time,
+    # e.g. python app/utils/venv_pool.py requirements-data.txt requirements-web.txt
+    pool = get_venv_pool()
+    pool.get([])
+    for requirements_path in sys.argv[1:]:
+        with open(requirements_path, "r") as requirements_file:
+            pool.get(requirements_file.read().splitlines())
+    print(f"Virtual environment pool: {pool.stats()}")
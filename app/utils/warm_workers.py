@@ -0,0 +1,222 @@
+import json
+import os
+import select
+import signal
+import struct
+import subprocess
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.utils.venv_pool import venv_python
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "exec_worker.py")
+
+# Imported once per worker if the virtualenv has them
+DEFAULT_PRELOAD = ("json", "re", "datetime", "requests", "numpy", "pandas")
+
+
+class WorkerError(Exception):
+    """The worker process died or broke the protocol, it cannot be reused."""
+
+
+class WarmWorker:
+    """
+    Client of one `exec_worker.py` process running in a virtualenv.
+
+    The process is started with the modules to preload and then serves
+    jobs one at a time, see app/utils/exec_worker.py for the protocol.
+    """
+
+    def __init__(self, venv_path: str, preload: Sequence[str] = DEFAULT_PRELOAD):
+        self.venv_path = venv_path
+        self.runs = 0
+        self.preloaded: List[str] = []
+        self._ready = False
+        self._job_pid: Optional[int] = None
+        # Unbuffered, `select` on the pipe would not see messages already in a read buffer
+        self.process = subprocess.Popen(
+            [venv_python(venv_path), WORKER_SCRIPT, *preload], bufsize=0,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def _read_exact(self, size: int, deadline: Optional[float]) -> bytes:
+        fd = self.process.stdout.fileno()
+        data = b""
+        while len(data) < size:
+            if deadline is not None and os.name == "posix":
+                readable, _, _ = select.select([fd], [], [], max(0.0, deadline - time.monotonic()))
+                if not readable:
+                    raise TimeoutError("Worker did not answer in time")
+            block = os.read(fd, size - len(data))
+            if not block:
+                raise WorkerError("Worker exited")
+            data += block
+        return data
+
+    def _read(self, timeout: Optional[float]) -> Dict[str, Any]:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        (length,) = struct.unpack(">I", self._read_exact(4, deadline))
+        return json.loads(self._read_exact(length, deadline).decode("utf-8"))
+
+    def _write(self, message: Dict[str, Any]):
+        data = json.dumps(message).encode("utf-8")
+        view = memoryview(struct.pack(">I", len(data)) + data)
+        while view:
+            view = view[self.process.stdin.write(view):]
+
+    def wait_ready(self, timeout: Optional[float] = 120):
+        """Wait until the worker has imported its preloaded modules."""
+        if not self._ready:
+            self.preloaded = self._read(timeout).get("preloaded", [])
+            self._ready = True
+
+    def run(self, script_path: str, cwd: str, env: Dict[str, str], timeout: Optional[float] = None,
+            cpu_seconds: Optional[int] = None, memory_mb: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Run a script in the worker.
+
+        Returns:
+            Dict[str, Any]: `returncode`, `stdout`, `stderr` and `timed_out`.
+        """
+        try:
+            self.wait_ready()
+            self._write({"script": script_path, "cwd": cwd, "env": env, "timeout": timeout,
+                         "cpu_seconds": cpu_seconds, "memory_mb": memory_mb})
+            # The job enforces its own timeout, this only guards against a stuck worker
+            result = self._read(timeout + 30 if timeout else None)
+            if "pid" in result:
+                self._job_pid = result["pid"]
+                result = self._read(timeout + 30 if timeout else None)
+        except (OSError, ValueError, TimeoutError) as e:
+            self.close()
+            raise WorkerError(str(e))
+
+        self._job_pid = None
+        self.runs += 1
+        return result
+
+    def _kill_job(self):
+        # The job runs in its own process group, see exec_worker.run_forked
+        if self._job_pid and hasattr(os, "killpg"):
+            try:
+                os.killpg(self._job_pid, signal.SIGKILL)
+            except OSError:
+                pass
+        self._job_pid = None
+
+    def close(self):
+        self._kill_job()
+        if self.alive:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except Exception:
+                self.process.kill()
+
+
+class WarmWorkerPool:
+    """
+    Idle warm workers per virtualenv.
+
+    Workers start once, import the commonly used modules of their
+    virtualenv and then run scripts sent to them, so a retry of the
+    developer loop does not pay for interpreter start-up and imports again.
+    Each job runs in a forked child of the worker. A worker is replaced
+    after `max_runs` jobs or when it crashes, and at most `max_idle` idle
+    workers are kept per virtualenv.
+    """
+
+    def __init__(self, preload: Sequence[str] = DEFAULT_PRELOAD, max_runs: int = 50, max_idle: int = 2):
+        self.preload = tuple(preload)
+        self.max_runs = max_runs
+        self.max_idle = max_idle
+        self._idle: Dict[str, List[WarmWorker]] = {}
+        self._lock = threading.Lock()
+
+        self.started = 0
+        self.reused = 0
+        self.recycled = 0
+
+    def _start(self, venv_path: str) -> WarmWorker:
+        self.started += 1
+        return WarmWorker(venv_path, self.preload)
+
+    def _acquire(self, venv_path: str) -> WarmWorker:
+        with self._lock:
+            idle = self._idle.get(venv_path, [])
+            while idle:
+                worker = idle.pop()
+                if worker.alive:
+                    self.reused += 1
+                    return worker
+            return self._start(venv_path)
+
+    def _release(self, worker: WarmWorker):
+        if not worker.alive or worker.runs >= self.max_runs:
+            self.recycled += 1
+            worker.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(worker.venv_path, [])
+            if len(idle) < self.max_idle:
+                idle.append(worker)
+                return
+        worker.close()
+
+    def run(self, venv_path: str, script_path: str, cwd: str, env: Dict[str, str],
+            timeout: Optional[float] = None, cpu_seconds: Optional[int] = None,
+            memory_mb: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Run a script on a warm worker of `venv_path`.
+
+        Raises:
+            WorkerError: if the worker crashed, the caller may fall back to a new interpreter.
+        """
+        worker = self._acquire(venv_path)
+        try:
+            return worker.run(script_path, cwd, env, timeout, cpu_seconds, memory_mb)
+        finally:
+            self._release(worker)
+
+    def close(self):
+        with self._lock:
+            workers = [worker for idle in self._idle.values() for worker in idle]
+            self._idle.clear()
+        for worker in workers:
+            worker.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            idle = sum(len(workers) for workers in self._idle.values())
+        return {"started": self.started, "reused": self.reused,
+                "recycled": self.recycled, "idle": idle}
+
+
+_pool: Optional[WarmWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> WarmWorkerPool:
+    """
+    Return the shared warm worker pool, creating it on first use.
+
+    Configured with `WORKER_PRELOAD` (comma separated modules),
+    `WORKER_MAX_RUNS` and `WORKER_MAX_IDLE`.
+    """
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                preload = os.getenv("WORKER_PRELOAD")
+                _pool = WarmWorkerPool(
+                    preload=[module.strip() for module in preload.split(",") if module.strip()]
+                    if preload is not None else DEFAULT_PRELOAD,
+                    max_runs=int(os.getenv("WORKER_MAX_RUNS", "50")),
+                    max_idle=int(os.getenv("WORKER_MAX_IDLE", "2"))
+                )
+    return _pool
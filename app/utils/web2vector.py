@@ -1,21 +1,29 @@
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 import datetime
 from datetime import timezone
 import json
 from urllib.parse import urlparse
 from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
-from typing import Any, List, Dict
+from typing import Any, AsyncIterable, List, Dict, Optional, Union
 import os
 import sys
 import numpy as np
 import psutil
 import asyncio
+import httpx
 from pydantic_ai import Agent
-import requests
-from xml.etree import ElementTree
-from FlagEmbedding import FlagModel
 from pydantic_ai.models.ollama import OllamaModel
-from supabase import create_client, Client
+from app.utils.chunk_writer import ChunkWriter
+from app.utils.chunking import chunk_text
+from app.utils.crawl_cache import CrawlCache, is_not_modified
+from app.utils.crawl_pool import BrowserSessionPool
+from app.utils.crawl_manifest import CrawlManifest, content_hash
+from app.utils.embeddings import EmbeddingBatcher, get_embedding_service
+from app.utils.llm_cache import LLMResultCache
+from app.utils.pipeline import Pipeline, Stage
+from app.utils.query_cache import mark_index_updated
+from app.utils.sitemap import iter_sitemap
+from app.utils.supabase_dal import SupabaseDAL, get_dal
 
 __location__ = os.path.dirname(os.path.abspath(__file__))
 __output__ = os.path.join(__location__, "output")
@@ -24,10 +32,12 @@ __output__ = os.path.join(__location__, "output")
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(parent_dir)
 
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_KEY")
-)
+# Chunk sizes are in characters unless CHUNK_UNIT is "tokens"
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "5000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "0"))
+CHUNK_UNIT = os.getenv("CHUNK_UNIT", "chars")
+
+supabase: SupabaseDAL = get_dal()
 
 
 @dataclass
@@ -41,38 +51,100 @@ class ProcessedChunk:
     embedding: List[float]
 
 
+@dataclass
+class PendingChunk:
+    """A chunk on its way through the ingestion pipeline."""
+    url: str
+    chunk_number: int
+    content: str
+    extracted: Optional[Dict[str, str]] = None
+    embedding: Optional[List[float]] = None
+
+
 title_summary_extractor = None
+title_summary_cache = None
+embedding_batcher = None
+chunk_writer = None
+crawl_manifest: Optional[CrawlManifest] = None
+crawl_cache: Optional[CrawlCache] = None
+
+
+def get_crawl_cache() -> CrawlCache:
+    """Return the on-disk store of crawled markdown, creating it on first use."""
 
+    global crawl_cache
 
-def get_all_docs_urls(sitemap_url):
-    f"""
-    Fetches all URLs from the given sitemap url.
-    Uses the sitemap ({sitemap_url}) to get these URLs.
+    if not crawl_cache:
+        crawl_cache = CrawlCache(os.getenv(
+            "CRAWL_CACHE_DIR", os.path.join(__output__, "crawl_cache")))
+    return crawl_cache
 
-    Returns:
-        List[str]: List of URLs
+
+def ingest_stages() -> List[Stage]:
     """
+    Build the chunk, summarise, embed and store stages of the ingestion pipeline.
 
-    try:
-        response = requests.get(sitemap_url)
-        response.raise_for_status()
+    They take (url, markdown) documents, so the same stages are fed by the
+    crawler or by pages replayed from the crawl cache. Stage sizes are read
+    from `CHUNK_WORKERS`, `SUMMARY_WORKERS`, `EMBEDDING_WORKERS`,
+    `STORE_WORKERS` and `PIPELINE_QUEUE_SIZE`.
+    """
 
-        # Parse the XML
-        root = ElementTree.fromstring(response.content)
+    async def chunk(document):
+        url, markdown = document
+        chunks = chunk_text(markdown, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_UNIT)
+        return [PendingChunk(url, i, chunks[i]) for i in await select_chunks(url, chunks)]
 
-        # Extract all URLs from the sitemap
-        # The namespace is usually defined in the root element
-        namespace = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
-        urls = [loc.text for loc in root.findall('.//ns:loc', namespace)]
+    async def summarise(pending: PendingChunk):
+        pending.extracted = await get_title_and_summary(pending.content, pending.url)
+        return [pending]
 
-        return urls
-    except Exception as e:
-        print(f"Error fetching sitemap: {e}")
+    async def embed(pending: PendingChunk):
+        pending.embedding = await get_embedding(pending.content)
+        return [pending]
+
+    async def store(pending: PendingChunk):
+        await insert_chunk(build_processed_chunk(pending.content, pending.chunk_number,
+                                                 pending.url, pending.extracted, pending.embedding))
         return []
 
+    queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE", "100"))
+    return [
+        Stage("chunk", chunk,
+              workers=int(os.getenv("CHUNK_WORKERS", "1")), queue_size=queue_size),
+        Stage("summarise", summarise,
+              workers=int(os.getenv("SUMMARY_WORKERS", "4")), queue_size=queue_size),
+        # Enough embed workers to fill a batch of the embedding batcher
+        Stage("embed", embed,
+              workers=int(os.getenv("EMBEDDING_WORKERS", os.getenv("EMBEDDING_BATCH_SIZE", "32"))), queue_size=queue_size),
+        Stage("store", store,
+              workers=int(os.getenv("STORE_WORKERS", "1")), queue_size=queue_size),
+    ]
+
 
-async def crawl_parallel(urls: List[str], max_concurrent: int = 5):
-    """Crawl multiple URLs in parallel with a concurrency limit."""
+async def run_pipeline(pipeline: Pipeline, source):
+    """Run an ingestion pipeline and report its stages."""
+    try:
+        await pipeline.run(source, report_interval=float(
+            os.getenv("PIPELINE_REPORT_INTERVAL", "0")))
+    finally:
+        pipeline.report()
+
+
+async def crawl_parallel(urls: Union[List[str], AsyncIterable[str]], max_concurrent: int = 5):
+    """
+    Crawl multiple URLs and ingest them through a staged pipeline.
+
+    Crawling, chunking, summarisation, embedding and storage each run their
+    own worker pool connected by bounded queues, so the browser keeps crawling
+    while earlier pages are still being summarised and embedded. `urls` can
+    also be an async iterable such as the stream of a sitemap parser.
+
+    Pages are crawled on a pool of `max_concurrent` browser sessions, see
+    `BrowserSessionPool` for the per-host limits. Crawled markdown is stored
+    in the crawl cache, and pages the server reports as not modified since
+    they were cached are taken from it without rendering them again.
+    """
     browser_config = BrowserConfig(
         headless=True,
         verbose=False,
@@ -85,80 +157,72 @@ async def crawl_parallel(urls: List[str], max_concurrent: int = 5):
     crawler = AsyncWebCrawler(config=browser_config)
     await crawler.start()
 
-    try:
-        # Create a semaphore to limit concurrency
-        semaphore = asyncio.Semaphore(max_concurrent)
-
-        async def process_url(url: str):
-            async with semaphore:
-                result = await crawler.arun(
-                    url=url,
-                    config=crawl_config,
-                    session_id="session1"
-                )
-                if result.success:
-                    print(f"Successfully crawled: {url}")
-                    await process_and_store_document(url, result.markdown_v2.raw_markdown)
-                else:
-                    print(f"Failed: {url} - Error: {result.error_message}")
-
-        # Process all URLs in parallel with limited concurrency
-
-        await asyncio.gather(*[process_url(url) for url in urls])
-    finally:
-        await crawler.close()
-
-
-def chunk_text(text: str, chunk_size: int = 5000) -> List[str]:
-    """Split text into chunks, respecting code blocks and paragraphs."""
-    chunks = []
-    start = 0
-    text_length = len(text)
-
-    while start < text_length:
-        # Calculate end position
-        end = start + chunk_size
+    # One browser session per crawl worker, recycled after a number of pages
+    session_pool = BrowserSessionPool(
+        crawler,
+        size=max_concurrent,
+        max_pages_per_session=int(os.getenv("CRAWL_SESSION_PAGES", "50")),
+        per_host_limit=int(os.getenv("CRAWL_PER_HOST", str(max_concurrent))),
+        min_host_interval=float(os.getenv("CRAWL_HOST_INTERVAL", "0.1"))
+    )
 
-        # If we're at the end of the text, just take what's left
-        if end >= text_length:
-            chunks.append(text[start:].strip())
-            break
+    cache = get_crawl_cache()
+    http_client = httpx.AsyncClient(follow_redirects=True, timeout=10)
+
+    async def crawl(url: str):
+        cached = await asyncio.to_thread(cache.header, url)
+        if cached and await is_not_modified(http_client, url, cached):
+            page = await asyncio.to_thread(cache.get, url)
+            if page:
+                print(f"Not modified, using cached page: {url}")
+                return [(url, page.markdown)]
+
+        result = await session_pool.crawl(url, crawl_config)
+        if result.success:
+            print(f"Successfully crawled: {url}")
+            markdown = result.markdown_v2.raw_markdown
+            await asyncio.to_thread(cache.put, url, markdown,
+                                    getattr(result, "response_headers", None))
+            return [(url, markdown)]
+
+        print(f"Failed: {url} - Error: {result.error_message}")
+        return []
 
-        # Try to find a code block boundary first (```)
-        chunk = text[start:end]
-        code_block = chunk.rfind('```')
-        if code_block != -1 and code_block > chunk_size * 0.3:
-            end = start + code_block
+    pipeline = Pipeline([
+        Stage("crawl", crawl, workers=max_concurrent,
+              queue_size=max_concurrent)
+    ] + ingest_stages())
 
-        # If no code block, try to break at a paragraph
-        elif '\n\n' in chunk:
-            # Find the last paragraph break
-            last_break = chunk.rfind('\n\n')
-            if last_break > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_break
+    try:
+        await run_pipeline(pipeline, urls)
+    finally:
+        await crawler.close()
+        await http_client.aclose()
+        session_pool.report()
 
-        # If no paragraph break, try to break at a sentence
-        elif '. ' in chunk:
-            # Find the last sentence break
-            last_period = chunk.rfind('. ')
-            if last_period > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_period + 1
 
-        # Extract chunk and clean it up
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
+async def ingest_from_cache():
+    """Re-chunk and re-index every page in the crawl cache without launching a browser."""
+    cache = get_crawl_cache()
 
-        # Move start position for next chunk
-        start = max(start + 1, end)
+    async def documents():
+        for path in cache.files():
+            page = await asyncio.to_thread(cache.read, path)
+            if page:
+                yield (page.url, page.markdown)
 
-    return chunks
+    await run_pipeline(Pipeline(ingest_stages()), documents())
 
 
 async def get_title_and_summary(chunk: str, url: str) -> Dict[str, str]:
-    """Extract title and summary using Ollama."""
+    """
+    Extract title and summary using Ollama.
+
+    Errors are raised, so the chunk fails in the pipeline instead of being
+    stored with a placeholder and is processed again on the next run.
+    """
 
-    global title_summary_extractor
+    global title_summary_extractor, title_summary_cache
 
     system_prompt = """You are an AI agent that extracts titles and summaries from documentation chunks.
     Return a JSON object with 'title' and 'summary' keys.
@@ -177,33 +241,51 @@ async def get_title_and_summary(chunk: str, url: str) -> Dict[str, str]:
                 tools=[]
             )
 
+        if not title_summary_cache:
+            title_summary_cache = LLMResultCache(
+                os.path.join(__output__, "title_summary_cache.db"),
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "100000")))
+
+        # The same chunk text (navigation, shared footers) gets the same title
+        # and summary regardless of the page it appears on
+        cache_key = LLMResultCache.make_key(
+            os.getenv("LLM_MODEL"), system_prompt, chunk[:1000])
+        cached = await title_summary_cache.aget(cache_key)
+        if cached is not None:
+            return cached
+
         response = await title_summary_extractor.run(f"URL: {url}\n\nContent:\n{chunk[:1000]}...")
+        await title_summary_cache.aput(cache_key, response.data)
         return response.data
     except Exception as e:
         print(f"Error getting title and summary: {e}")
-        return {"title": "Error processing title", "summary": "Error processing summary"}
+        raise
 
 
 async def get_embedding(text: str) -> List[float]:
-    """Get embedding vector from OpenAI."""
+    """
+    Get embedding vector from the shared embedding model, batched with concurrent callers.
+
+    Errors are raised rather than storing the chunk with a zero vector.
+    """
+
+    global embedding_batcher
+
     try:
-        model = FlagModel('BAAI/bge-base-en-v1.5',
-                          query_instruction_for_retrieval="Represent this sentence for searching relevant passages:",
-                          use_fp16=True)
-        return model.encode(text).tolist()
+        if not embedding_batcher:
+            embedding_batcher = EmbeddingBatcher(
+                max_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "32")),
+                max_wait_ms=float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "20")))
+
+        return await embedding_batcher.embed(text)
     except Exception as e:
         print(f"Error getting embedding: {e}")
-        return [0] * 768  # Return zero vector on error
-
+        raise
 
-async def process_chunk(chunk: str, chunk_number: int, url: str) -> ProcessedChunk:
-    """Process a single chunk of text."""
-    # Get title and summary
-    extracted = await get_title_and_summary(chunk, url)
-
-    # Get embedding
-    embedding = await get_embedding(chunk)
 
+def build_processed_chunk(chunk: str, chunk_number: int, url: str,
+                          extracted: Dict[str, str], embedding: List[float]) -> ProcessedChunk:
+    """Assemble the stored record of a chunk from its title, summary and embedding."""
     # Create metadata
     metadata = {
         "source": "pydantic_ai_docs",
@@ -223,55 +305,131 @@ async def process_chunk(chunk: str, chunk_number: int, url: str) -> ProcessedChu
     )
 
 
+def get_chunk_writer() -> ChunkWriter:
+    """Return the shared bulk writer for `site_pages`, creating it on first use."""
+
+    global chunk_writer
+
+    if not chunk_writer:
+        chunk_writer = ChunkWriter(
+            supabase,
+            batch_size=int(os.getenv("CHUNK_WRITE_BATCH_SIZE", "100")),
+            flush_interval=float(os.getenv("CHUNK_WRITE_FLUSH_INTERVAL", "2")),
+            on_write=on_chunks_written
+        )
+    return chunk_writer
+
+
+def on_chunks_written(rows: List[Dict[str, Any]]):
+    """Mark the written chunks as done in the manifest and let retrieval caches know they may be stale."""
+    mark_index_updated()
+    if crawl_manifest is not None:
+        for row in rows:
+            crawl_manifest.confirm_chunk(row["url"], row["chunk_number"])
+
+
 async def insert_chunk(chunk: ProcessedChunk):
-    """Insert a processed chunk into Supabase."""
+    """Queue a processed chunk for a bulk upsert into Supabase."""
     try:
-        data = {
-            "url": chunk.url,
-            "chunk_number": chunk.chunk_number,
-            "title": chunk.title,
-            "summary": chunk.summary,
-            "content": chunk.content,
-            "metadata": chunk.metadata,
-            "embedding": chunk.embedding
-        }
-
-        result = supabase.table("site_pages").insert(data).execute()
-        print(f"Inserted chunk {chunk.chunk_number} for {chunk.url}")
-        return result
+        await get_chunk_writer().add(asdict(chunk))
     except Exception as e:
         print(f"Error inserting chunk: {e}")
-        return None
 
 
-async def process_and_store_document(url: str, markdown: str):
-    """Process a document and store its chunks in parallel."""
-    # Split into chunks
-    chunks = chunk_text(markdown)
+async def delete_stale_chunks(url: str, chunk_count: int):
+    """Delete chunks of `url` beyond `chunk_count` left over from a longer previous version."""
+    try:
+        await supabase.delete("site_pages", [("url", "eq", url),
+                                             ("chunk_number", "gte", chunk_count)])
+    except Exception as e:
+        print(f"Error deleting stale chunks for {url}: {e}")
 
-    # Process chunks in parallel
-    tasks = [
-        process_chunk(chunk, i, url)
-        for i, chunk in enumerate(chunks)
-    ]
-    processed_chunks = await asyncio.gather(*tasks)
 
-    # Store chunks in parallel
-    insert_tasks = [
-        insert_chunk(chunk)
-        for chunk in processed_chunks
-    ]
-    await asyncio.gather(*insert_tasks)
+async def select_chunks(url: str, chunks: List[str]) -> List[int]:
+    """
+    Return the numbers of the chunks of `url` that need to be processed.
+
+    Without a manifest that is every chunk. In incremental mode only chunks
+    whose content hash changed are returned and stale trailing chunks of a
+    page that got shorter are deleted. The returned chunks are recorded in
+    the manifest once the chunk writer has stored them.
+    """
+    if crawl_manifest is None:
+        return list(range(len(chunks)))
+
+    hashes = [content_hash(chunk) for chunk in chunks]
+    chunk_numbers = crawl_manifest.changed_chunks(url, hashes)
+    if crawl_manifest.previous_chunk_count(url) > len(chunks):
+        await delete_stale_chunks(url, len(chunks))
+    crawl_manifest.start_page(url, hashes, chunk_numbers)
+    print(f"{url}: {len(chunk_numbers)} of {len(chunks)} chunks changed")
 
+    return chunk_numbers
+
+
+async def main(incremental: bool = False, from_cache: bool = False):
+    global crawl_manifest
 
-async def main():
     sitemap = "https://ai.pydantic.dev/sitemap.xml"
-    urls = get_all_docs_urls(sitemap)
-    if urls:
-        print(f"Found {len(urls)} URLs to crawl")
-        await crawl_parallel(urls, max_concurrent=1)
-    else:
-        print("No URLs found to crawl")
+
+    if incremental:
+        crawl_manifest = CrawlManifest(
+            os.path.join(__output__, "crawl_manifest.json")).load()
+
+    found = 0
+    skipped = 0
+
+    async def urls_to_crawl():
+        nonlocal found, skipped
+        async for url, lastmod in iter_sitemap(sitemap):
+            found += 1
+            if crawl_manifest is not None:
+                crawl_manifest.record_sitemap(url, lastmod)
+                if crawl_manifest.is_unchanged(url, lastmod):
+                    skipped += 1
+                    continue
+            yield url
+
+    try:
+        if from_cache:
+            await ingest_from_cache()
+        else:
+            await crawl_parallel(urls_to_crawl(),
+                                 max_concurrent=int(os.getenv("CRAWL_WORKERS", "5")))
+    finally:
+        if chunk_writer:
+            await chunk_writer.close()
+        # Only chunks the writer stored have their hash recorded, the rest
+        # are processed again on the next run
+        if crawl_manifest is not None:
+            crawl_manifest.save()
+        if title_summary_cache:
+            title_summary_cache.close()
+        await supabase.close()
+
+    if not from_cache:
+        if not found:
+            print("No URLs found to crawl")
+            return
+        print(f"Found {found} URLs, skipped {skipped} unchanged")
+
+    print(f"Embedding metrics: {get_embedding_service().metrics()}")
+    if embedding_batcher:
+        print(f"Embedding batches: {embedding_batcher.stats()}")
+    if title_summary_cache:
+        print(f"Title/summary cache: {title_summary_cache.stats()}")
+    print(f"Supabase: {supabase.stats()}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Crawl a documentation sitemap into Supabase.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="skip pages and chunks that did not change since the last run")
+    parser.add_argument("--from-cache", action="store_true",
+                        help="re-index the pages stored in the crawl cache without crawling")
+    args = parser.parse_args()
+
+    asyncio.run(main(incremental=args.incremental,
+                from_cache=args.from_cache))
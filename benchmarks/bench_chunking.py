@@ -0,0 +1,102 @@
+"""
+Micro-benchmark of app.utils.chunking against the previous chunk_text.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_chunking.py [size_in_mb]
+"""
+import random
+import sys
+import time
+from typing import List
+
+from app.utils.chunking import chunk_spans, chunk_text
+
+
+def legacy_chunk_text(text: str, chunk_size: int = 5000) -> List[str]:
+    """The window-slicing chunker web2vector used before app.utils.chunking."""
+    chunks = []
+    start = 0
+    text_length = len(text)
+
+    while start < text_length:
+        end = start + chunk_size
+
+        if end >= text_length:
+            chunks.append(text[start:].strip())
+            break
+
+        chunk = text[start:end]
+        code_block = chunk.rfind('```')
+        if code_block != -1 and code_block > chunk_size * 0.3:
+            end = start + code_block
+
+        elif '\n\n' in chunk:
+            last_break = chunk.rfind('\n\n')
+            if last_break > chunk_size * 0.3:
+                end = start + last_break
+
+        elif '. ' in chunk:
+            last_period = chunk.rfind('. ')
+            if last_period > chunk_size * 0.3:
+                end = start + last_period + 1
+
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+
+        start = max(start + 1, end)
+
+    return chunks
+
+
+def make_markdown(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    words = ["agent", "model", "tool", "result", "pydantic", "the", "a", "run",
+             "context", "dependency", "stream", "response", "validate", "system"]
+    parts = []
+    length = 0
+    while length < size:
+        kind = rng.random()
+        if kind < 0.15:
+            body = "\n".join("    " + " ".join(rng.choices(words, k=rng.randint(3, 10)))
+                             for _ in range(rng.randint(3, 30)))
+            part = f"```python\n{body}\n```"
+        elif kind < 0.25:
+            part = "## " + " ".join(rng.choices(words, k=rng.randint(2, 6))).title()
+        else:
+            part = " ".join(
+                " ".join(rng.choices(words, k=rng.randint(5, 20))).capitalize() + "."
+                for _ in range(rng.randint(1, 8)))
+        parts.append(part)
+        length += len(part) + 2
+    return "\n\n".join(parts)
+
+
+def timed(function, *args, repeat: int = 5, **kwargs):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    text = make_markdown(int(size_mb * 1024 * 1024))
+    print(f"Markdown size: {len(text) / 1024 / 1024:.1f} MB")
+
+    legacy_time, legacy_chunks = timed(legacy_chunk_text, text)
+    spans_time, spans = timed(chunk_spans, text)
+    text_time, chunks = timed(chunk_text, text)
+    tokens_time, token_spans = timed(
+        chunk_spans, text, chunk_size=1200, overlap=100, unit="tokens")
+
+    print(f"legacy chunk_text:      {legacy_time * 1000:8.1f} ms  {len(legacy_chunks)} chunks")
+    print(f"chunk_spans (offsets):  {spans_time * 1000:8.1f} ms  {len(spans)} chunks")
+    print(f"chunk_text (strings):   {text_time * 1000:8.1f} ms  {len(chunks)} chunks")
+    print(f"chunk_spans (tokens):   {tokens_time * 1000:8.1f} ms  {len(token_spans)} chunks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Recall and size of quantized embeddings against full float32.
+
+Vectors are clustered random data shaped like bge-base embeddings, or the
+vectors of a local index built with app/utils/vector_index.py. Queries are
+perturbed corpus vectors, recall@k is measured against float32 brute force.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_quantization.py [chunks] [index_dir]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+from app.utils.embeddings import EMBEDDING_DIMENSION
+from app.utils.quantization import QUANTIZATION_MODES, bytes_per_vector, dequantize, quantize
+
+
+def make_vectors(count: int, dimension: int = EMBEDDING_DIMENSION, clusters: int = 64,
+                 seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    vectors = centres[rng.integers(clusters, size=count)] + \
+        rng.normal(scale=0.8, size=(count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def top_k(vectors: np.ndarray, queries: np.ndarray, k: int, scales=None) -> np.ndarray:
+    scores = (queries @ vectors.T).astype(np.float32)
+    if scales is not None:
+        scores *= scales
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    if len(sys.argv) > 2:
+        vectors = np.load(os.path.join(sys.argv[2], "vectors.npy")).astype(np.float32)
+        scales_path = os.path.join(sys.argv[2], "scales.npy")
+        if os.path.exists(scales_path):
+            vectors = dequantize(vectors, np.load(scales_path))
+    else:
+        vectors = make_vectors(count)
+
+    rng = np.random.default_rng(1)
+    k = 10
+    queries = vectors[rng.choice(len(vectors), size=200, replace=False)] + \
+        rng.normal(scale=0.05, size=(200, vectors.shape[1])).astype(np.float32)
+    expected = top_k(vectors, queries, k)
+
+    print(f"{len(vectors)} vectors of dimension {vectors.shape[1]}, recall@{k} over {len(queries)} queries")
+    print(f"{'mode':>8} {'bytes/vector':>13} {'MB':>8} {'GB/1M chunks':>13} {'recall':>7} {'ms/query':>9}")
+    for mode in QUANTIZATION_MODES:
+        codes, scales = quantize(vectors, mode)
+        start = time.perf_counter()
+        found = top_k(codes, queries, k, scales)
+        elapsed = (time.perf_counter() - start) / len(queries) * 1000
+
+        recall = np.mean([len(set(found[i]) & set(expected[i])) / k for i in range(len(queries))])
+        size = bytes_per_vector(vectors.shape[1], mode)
+        print(f"{mode:>8} {size:>13} {size * len(vectors) / 2**20:>8.1f} "
+              f"{size * 1e6 / 2**30:>13.2f} {recall:>7.3f} {elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import asyncio
+
+from app.utils.chunk_writer import ChunkWriter
+
+
+class StubError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class StubClient:
+    """Rejects batches containing `bad` with a 400, or every batch with `status_code`."""
+
+    def __init__(self, bad=(), status_code=None):
+        self.bad = set(bad)
+        self.status_code = status_code
+        self.calls = 0
+        self.rows = []
+
+    async def upsert(self, table, rows, on_conflict):
+        self.calls += 1
+        if self.status_code:
+            raise StubError(self.status_code)
+        if any(row["chunk_number"] in self.bad for row in rows):
+            raise StubError(400)
+        self.rows.extend(rows)
+
+
+def make_rows(count):
+    return [{"url": "https://example.com", "chunk_number": number, "content": "x"}
+            for number in range(count)]
+
+
+async def write(client, rows):
+    written = []
+    writer = ChunkWriter(client, batch_size=len(rows), flush_interval=60, on_write=written.extend)
+    for row in rows:
+        await writer.add(row)
+    await writer.close()
+    return writer, written
+
+
+def test_rejected_row_is_isolated():
+    client = StubClient(bad={42})
+    writer, written = asyncio.run(write(client, make_rows(100)))
+
+    assert [row["chunk_number"] for row in writer.failed] == [42]
+    assert len(written) == 99
+    assert writer.written == 99
+    assert client.calls <= 2 * 7 + 1
+
+
+def test_transient_error_fails_batch_without_splitting():
+    client = StubClient(status_code=503)
+    writer, written = asyncio.run(write(client, make_rows(100)))
+
+    assert client.calls == 1
+    assert len(writer.failed) == 100
+    assert written == []
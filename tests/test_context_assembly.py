@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+from app.utils.chunking import chunk_text
+from app.utils.context_assembly import trim_overlap
+
+
+def make_text(paragraphs=60, seed=0):
+    rng = random.Random(seed)
+    words = ["agent", "model", "tool", "result", "stream", "context", "retry", "schema",
+             "token", "prompt", "dependency", "validator", "message", "history"]
+    return "\n\n".join(
+        ". ".join(" ".join(rng.choice(words) for _ in range(rng.randint(6, 14)))
+                  for _ in range(rng.randint(2, 6))) + "."
+        for _ in range(paragraphs))
+
+
+@pytest.mark.parametrize("overlap", [30, 50, 150, 199, 200, 300])
+def test_trim_overlap_of_chunked_text(overlap):
+    text = make_text()
+    chunks = chunk_text(text, 1000, overlap)
+    assert len(chunks) > 5
+
+    rebuilt = chunks[0]
+    for previous, current in zip(chunks, chunks[1:]):
+        trimmed = trim_overlap(previous, current)
+        assert len(trimmed) < len(current)
+        assert current.endswith(trimmed)
+        rebuilt += "\n\n" + trimmed
+    # Every overlap was removed, nothing else was
+    assert rebuilt.split() == text.split()
+
+
+def test_trim_overlap_shorter_than_probe():
+    previous = "The first chunk ends with a short overlap sentence."
+    current = "a short overlap sentence. The second chunk goes on."
+    assert trim_overlap(previous, current) == "The second chunk goes on."
+
+
+def test_trim_overlap_ignores_coincidental_match():
+    assert trim_overlap("It ends with a dot.", ". Then it goes on.") == ". Then it goes on."
+    assert trim_overlap("No overlap here.", "Something else entirely.") == "Something else entirely."
@@ -0,0 +1,45 @@
+import os
+import select
+import sys
+import time
+
+import pytest
+
+from app.utils import warm_workers
+from app.utils.warm_workers import WarmWorker
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="warm workers fork per job")
+
+
+@pytest.fixture
+def worker(tmp_path):
+    venv_path = tmp_path / "venv"
+    (venv_path / "bin").mkdir(parents=True)
+    os.symlink(sys.executable, venv_path / "bin" / "python")
+    worker = WarmWorker(str(venv_path), preload=())
+    yield worker
+    worker.close()
+
+
+def test_run_with_late_client(worker, tmp_path, monkeypatch):
+    # The pid and result messages arrive together while the client is late
+    real_select = select.select
+
+    def late_select(*args):
+        time.sleep(0.2)
+        return real_select(*args)
+
+    monkeypatch.setattr(warm_workers.select, "select", late_select)
+
+    job_dir = tmp_path / "job"
+    job_dir.mkdir()
+    script = job_dir / "script.py"
+    script.write_text("print('hi')\n")
+
+    started = time.monotonic()
+    result = worker.run(str(script), str(job_dir), dict(os.environ), timeout=1)
+
+    assert time.monotonic() - started < 10
+    assert result["returncode"] == 0
+    assert result["stdout"] == "hi\n"
+    assert worker.alive